@@ -1,7 +1,14 @@
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 import socketio
-from app.socketio import sio
+from app.socketio import sio, broadcaster
+from app.services.browser_pool import browser_pool
+from app.services.resource_cache import resource_cache
+from app.services.scheduler import scheduler
+from app.services import dispatch
+from app.services.metrics import metrics
+from app.store import store
 
 # Create FastAPI app
 app = FastAPI(title="TestPilot API")
@@ -27,11 +34,51 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "create_test": "POST /api/test/",
+            "create_batch": "POST /api/test/batch",
+            "get_batch": "GET /api/test/batch/{batch_id}",
             "get_test": "GET /api/test/{test_id}",
-            "get_test_cases": "GET /api/test/{test_id}/cases"
+            "cancel_test": "DELETE /api/test/{test_id}",
+            "get_test_cases": "GET /api/test/{test_id}/cases",
+            "get_screenshot": "GET /api/test/{test_id}/screenshots/{hash}",
+            "stats": "GET /stats",
+            "metrics": "GET /metrics"
         }
     }
 
+@app.on_event("shutdown")
+async def shutdown():
+    await scheduler.shutdown()
+    await browser_pool.close()
+
+# Runtime stats
+@app.get("/stats")
+async def stats():
+    return {
+        "browser_pool": browser_pool.stats(),
+        "resource_cache": resource_cache.stats(),
+        "scheduler": {"mode": dispatch.RUN_MODE, "queue_depth": dispatch.queue.queue_depth, "active": dispatch.queue.active},
+    }
+
+# Prometheus scrape endpoint
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    pool = browser_pool.stats()
+    cache = resource_cache.stats()
+    body = metrics.render({
+        "queue_depth": ("Runs waiting for a scheduler slot.", dispatch.queue.queue_depth),
+        "active_runs": ("Runs currently executing.", dispatch.queue.active),
+        "store_runs": ("Runs held by the store.", len(store)),
+        "pool_browsers": ("Browsers open in the pool.", pool["browsers"]),
+        "pool_contexts_in_use": ("Browser contexts currently borrowed.", pool["in_use"]),
+        "pool_hits": ("Context requests served by a warm browser.", pool["hits"]),
+        "pool_misses": ("Context requests that launched a browser.", pool["misses"]),
+        "resource_cache_hits": ("Subresource requests served from the resource cache.", cache["hits"]),
+        "resource_cache_misses": ("Cacheable subresource requests fetched from the network.", cache["misses"]),
+        "resource_cache_blocked": ("Requests aborted by the blocklists.", cache["blocked"]),
+        "resource_cache_bytes": ("Bytes held by the resource cache.", cache["bytes"]),
+    })
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
 # Include routes
 from app.routes import test
 app.include_router(test.router, prefix="/api/test", tags=["test"])
@@ -43,9 +90,9 @@ async def connect(sid, environ):
     # Parse test_id from query string and join room
     if 'testId=' in query:
         test_id = query.split('testId=')[1].split('&')[0]
-        await sio.enter_room(sid, test_id)
+        await broadcaster.join(sid, test_id)
 
 @sio.event
 async def disconnect(sid):
-    pass
+    broadcaster.leave(sid)
 
@@ -1,23 +1,148 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
 from typing import Optional, Literal
 from datetime import datetime
 
 class TestRequest(BaseModel):
     url: str
     focus: str
+    replay: bool = False
+    observation: Optional[Literal["screenshot", "dom"]] = None
+    trace: Optional[bool] = None  # Record a Playwright trace for the export bundle
+    # "cases" plans test cases from the focus first and runs them concurrently
+    mode: Literal["explore", "cases"] = "explore"
+    priority: Literal["high", "normal", "low"] = "normal"
+    deadline_seconds: Optional[float] = Field(None, gt=0)
+    settle_timeout_ms: Optional[int] = None
+    navigation_timeout_ms: Optional[int] = None
 
 class TestResponse(BaseModel):
     id: str
     status: str
 
+class BatchRequest(BaseModel):
+    url: str
+    focuses: list[str]
+    setup_focus: Optional[str] = None
+    priority: Literal["high", "normal", "low"] = "normal"
+    settle_timeout_ms: Optional[int] = None
+    navigation_timeout_ms: Optional[int] = None
+
+class BatchResponse(BaseModel):
+    id: str
+    status: str
+    setup_test_id: Optional[str] = None
+    test_ids: list[str]
+
 class Action(BaseModel):
-    type: Literal["navigate", "click_at", "type_text_at", "scroll_document", "go_back", "go_forward", "wait_5_seconds", "key_combination", "click", "input", "screenshot", "done"]
+    type: Literal["navigate", "click_at", "type_text_at", "click_element", "type_into_element", "scroll_document", "go_back", "go_forward", "wait_5_seconds", "key_combination", "click", "input", "screenshot", "done"]
     element: Optional[str] = None
     value: Optional[str] = None
     reasoning: Optional[str] = None
-    screenshot: Optional[str] = None
+    screenshot: Optional[str] = None  # Blob store hash, served by GET /api/test/{test_id}/screenshots/{hash}
+    replayed: bool = False
+    settle_ms: Optional[int] = None
+    diff_score: Optional[float] = None  # Visual change caused by the step, 0-1
+    case_id: Optional[str] = None  # Set when the run executes generated test cases
     timestamp: datetime
 
+# Actions the agent can decide on, as listed in the agent's system prompt
+DecisionAction = Literal["navigate", "click_at", "type_text_at", "click_element", "type_into_element", "scroll_document", "go_back", "go_forward", "wait_5_seconds", "key_combination", "done"]
+
+# Actions allowed as follow-up steps of a plan; finishing needs a fresh look at the screen
+PlanAction = Literal["navigate", "click_at", "type_text_at", "click_element", "type_into_element", "scroll_document", "go_back", "go_forward", "wait_5_seconds", "key_combination"]
+
+# Arguments each action cannot do without
+DECISION_REQUIRED_ARGS = {
+    "navigate": ("url",),
+    "click_at": ("x", "y"),
+    "type_text_at": ("x", "y", "text"),
+    "click_element": ("index",),
+    "type_into_element": ("index", "text"),
+    "scroll_document": ("direction",),
+    "key_combination": ("keys",),
+}
+
+class DecisionArgs(BaseModel):
+    url: Optional[str] = None
+    x: Optional[int] = Field(None, ge=0, le=999)
+    y: Optional[int] = Field(None, ge=0, le=999)
+    index: Optional[int] = Field(None, ge=0)
+    text: Optional[str] = None
+    press_enter: Optional[bool] = None
+    clear_before_typing: Optional[bool] = None
+    direction: Optional[Literal["up", "down", "left", "right"]] = None
+    keys: Optional[str] = None
+    success: Optional[bool] = None
+    message: Optional[str] = None
+
+def _check_required_args(action: str, args: DecisionArgs) -> None:
+    missing = [name for name in DECISION_REQUIRED_ARGS.get(action, ()) if getattr(args, name) is None]
+    if missing:
+        raise ValueError(f"{action} requires {', '.join(missing)}")
+
+class PlanStep(BaseModel):
+    action: PlanAction
+    args: DecisionArgs
+
+    @model_validator(mode="after")
+    def _check_args(self):
+        _check_required_args(self.action, self.args)
+        return self
+
+class Decision(BaseModel):
+    """One model decision; also the response schema the model is constrained to.
+
+    `plan` holds optional follow-up steps to run right after `action`
+    without asking the model again.
+    """
+    observation: str
+    reasoning: str
+    action: DecisionAction
+    args: DecisionArgs
+    plan: list[PlanStep] = []
+
+    @model_validator(mode="after")
+    def _check_args(self):
+        _check_required_args(self.action, self.args)
+        return self
+
+    def as_dict(self) -> dict:
+        """Plain dict with only the arguments that were given."""
+        return {
+            "observation": self.observation,
+            "reasoning": self.reasoning,
+            "action": self.action,
+            "args": self.args.model_dump(exclude_none=True),
+            "plan": [{"action": step.action, "args": step.args.model_dump(exclude_none=True)} for step in self.plan],
+        }
+
+# Screenshot observation stamps no element indexes, so its schema leaves the element actions out
+ScreenshotDecisionAction = Literal["navigate", "click_at", "type_text_at", "scroll_document", "go_back", "go_forward", "wait_5_seconds", "key_combination", "done"]
+ScreenshotPlanAction = Literal["navigate", "click_at", "type_text_at", "scroll_document", "go_back", "go_forward", "wait_5_seconds", "key_combination"]
+
+class ScreenshotPlanStep(PlanStep):
+    action: ScreenshotPlanAction
+
+class ScreenshotDecision(Decision):
+    """Decision schema for screenshot observation."""
+    action: ScreenshotDecisionAction
+    plan: list[ScreenshotPlanStep] = []
+
+class PlannedCase(BaseModel):
+    title: str
+    steps: list[str]
+    expected: str
+
+class CasePlan(BaseModel):
+    """Reply schema of the planning pass in "cases" mode."""
+    cases: list[PlannedCase]
+
+class Span(BaseModel):
+    phase: str
+    turn: Optional[int] = None
+    started_at: datetime
+    duration_ms: float
+
 class TestCase(BaseModel):
     id: str
     title: str
@@ -31,9 +156,27 @@ class TestRun(BaseModel):
     id: str
     url: str
     focus: str
-    status: Literal["running", "complete", "failed"]
+    status: Literal["queued", "running", "complete", "failed", "cancelled"]
     actions: list[Action] = []
     cases: list[TestCase] = []
     created_at: datetime
     completed_at: Optional[datetime] = None
+    queued_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    queue_position: Optional[int] = None
+    wait_seconds: Optional[float] = None
+    spans: list[Span] = []
+    parse_failures: int = 0
+    wasted_calls: int = 0
+    trace: bool = False  # A Playwright trace was saved for the export bundle
+
 
+class TestBatch(BaseModel):
+    id: str
+    url: str
+    focuses: list[str]
+    setup_focus: Optional[str] = None
+    setup_test_id: Optional[str] = None
+    test_ids: list[str]
+    status: Literal["setup", "running"]
+    created_at: datetime
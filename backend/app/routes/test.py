@@ -1,24 +1,36 @@
-from fastapi import APIRouter, BackgroundTasks, HTTPException
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Header, Query, Response
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+import hashlib
 from nanoid import generate
 from datetime import datetime
 
-from app.models import TestRequest, TestResponse, TestRun
+from app.models import TestRequest, TestResponse, TestRun, BatchRequest, BatchResponse, TestBatch
 from app.store import store
-from app.services.agent import run_agent
-from app.socketio import sio
+from app.services.blobs import blob_store
+from app.services.settle import SETTLE_TIMEOUT_MS, NAVIGATION_TIMEOUT_MS
+from app.services.observe import OBSERVATION_MODE
+from app.services.export import PLAYWRIGHT_TRACE, export_archive
+from app.services.scheduler import QueueFull
+from app.services.batch import batch_status, cancel_batch, cancel_waiting
+from app.services import dispatch
 
 router = APIRouter()
 
 @router.post("/", response_model=TestResponse)
-async def create_test(request: TestRequest, background_tasks: BackgroundTasks):
-    """Start a new test run."""
+async def create_test(request: TestRequest):
+    """Queue a new test run."""
+    # Cases run in several contexts at once, which one trace cannot cover
+    if request.mode == "cases" and request.trace:
+        raise HTTPException(status_code=422, detail="Playwright traces are not supported with mode \"cases\"")
+    
     test_id = f"test_{generate(size=10)}"
     
     test_run = TestRun(
         id=test_id,
         url=request.url,
         focus=request.focus,
-        status="running",
+        status="queued",
         actions=[],
         cases=[],
         created_at=datetime.now()
@@ -26,24 +38,226 @@ async def create_test(request: TestRequest, background_tasks: BackgroundTasks):
     
     store.set(test_id, test_run)
     
-    # Run agent in background
-    background_tasks.add_task(run_agent, test_id, request.url, request.focus, sio)
+    # Hand the agent to the scheduler or a worker; it starts once a slot is free
+    try:
+        dispatch.submit(
+            test_id,
+            "cases" if request.mode == "cases" else "run",
+            {
+                "url": request.url,
+                "focus": request.focus,
+                "replay": request.replay,
+                "observation_mode": request.observation or OBSERVATION_MODE,
+                "trace": request.mode != "cases" and (PLAYWRIGHT_TRACE if request.trace is None else request.trace),
+                "settle_timeout_ms": request.settle_timeout_ms or SETTLE_TIMEOUT_MS,
+                "navigation_timeout_ms": request.navigation_timeout_ms or NAVIGATION_TIMEOUT_MS,
+            },
+            priority=request.priority,
+            deadline=request.deadline_seconds,
+        )
+    except QueueFull as e:
+        store.update(test_id, status="failed", completed_at=datetime.now())
+        raise HTTPException(status_code=429, detail=str(e))
+    
+    return TestResponse(id=test_id, status=store.get(test_id).status)
+
+@router.post("/batch", response_model=BatchResponse)
+async def create_batch(request: BatchRequest):
+    """Queue many focuses against one URL, sharing a single navigation and setup."""
+    if not request.focuses:
+        raise HTTPException(status_code=422, detail="At least one focus is required")
+    # The setup job and every focus need a queue slot
+    if not dispatch.queue.has_capacity(len(request.focuses) + 1):
+        raise HTTPException(status_code=429, detail=f"Run queue is full ({dispatch.queue.queue_size} waiting)")
+    
+    batch_id = f"batch_{generate(size=10)}"
+    now = datetime.now()
+    
+    def new_run(focus: str) -> str:
+        test_id = f"test_{generate(size=10)}"
+        store.set(test_id, TestRun(id=test_id, url=request.url, focus=focus, status="queued", created_at=now))
+        return test_id
     
-    return TestResponse(id=test_id, status="running")
+    setup_test_id = new_run(request.setup_focus) if request.setup_focus else None
+    test_ids = [new_run(focus) for focus in request.focuses]
+    store.set_batch(batch_id, TestBatch(
+        id=batch_id,
+        url=request.url,
+        focuses=request.focuses,
+        setup_focus=request.setup_focus,
+        setup_test_id=setup_test_id,
+        test_ids=test_ids,
+        status="setup",
+        created_at=now
+    ))
+    
+    # The setup runs as one scheduled job, which queues the focuses once it is done
+    try:
+        dispatch.submit(
+            setup_test_id or batch_id,
+            "batch",
+            {
+                "batch_id": batch_id,
+                "priority": request.priority,
+                "settle_timeout_ms": request.settle_timeout_ms or SETTLE_TIMEOUT_MS,
+                "navigation_timeout_ms": request.navigation_timeout_ms or NAVIGATION_TIMEOUT_MS,
+            },
+            priority=request.priority,
+        )
+    except QueueFull as e:
+        # The queue filled up since the capacity check; none of the batch's runs will start
+        for test_id in ([setup_test_id] if setup_test_id else []) + test_ids:
+            store.update(test_id, status="failed", completed_at=datetime.now())
+        store.update_batch(batch_id, status="running")
+        raise HTTPException(status_code=429, detail=str(e))
+    
+    return BatchResponse(id=batch_id, status="setup", setup_test_id=setup_test_id, test_ids=test_ids)
+
+@router.get("/batch/{batch_id}")
+async def get_batch(batch_id: str):
+    """Get the aggregate status of a batch."""
+    batch = store.get_batch(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return {
+        "id": batch_id,
+        "url": batch.url,
+        "setup_test_id": batch.setup_test_id,
+        "test_ids": batch.test_ids,
+        **batch_status(batch),
+    }
+
+@router.delete("/batch/{batch_id}")
+async def cancel_batch_runs(batch_id: str):
+    """Cancel a batch's setup and every focus that has not finished."""
+    batch = store.get_batch(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    if not cancel_batch(batch):
+        raise HTTPException(status_code=409, detail="Batch has already finished")
+    return {"id": batch_id, **batch_status(store.get_batch(batch_id))}
 
 @router.get("/{test_id}")
-async def get_test(test_id: str):
-    """Get test run status and results."""
+async def get_test(
+    test_id: str,
+    fields: Optional[str] = Query(None, description="Comma-separated top-level fields to return"),
+    exclude: Optional[str] = Query(None, description="Comma-separated fields to omit, e.g. actions.screenshot"),
+    since: int = Query(0, ge=0, description="Return actions from this index on"),
+    limit: Optional[int] = Query(None, ge=1, description="Maximum actions to return"),
+    cases_offset: int = Query(0, ge=0),
+    cases_limit: Optional[int] = Query(None, ge=1),
+    if_none_match: Optional[str] = Header(None),
+):
+    """Get test run status and results.
+
+    Supports field projection, an action cursor (`since`) and pagination of
+    actions and cases. Responses carry an ETag; a matching If-None-Match is
+    answered with 304 without loading or serialising the run.
+    """
+    queue_position = dispatch.queue.position(test_id)
+    
+    # The version is read before the run, so the ETag never claims data newer than the body
+    query = f"{fields}|{exclude}|{since}|{limit}|{cases_offset}|{cases_limit}|{queue_position}"
+    etag = f'W/"{store.epoch}-{store.version(test_id)}-{hashlib.sha1(query.encode()).hexdigest()[:12]}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match and etag in [t.strip() for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    
+    test_run = store.get(test_id)
+    if not test_run:
+        raise HTTPException(status_code=404, detail="Test not found")
+    if if_none_match and if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    
+    actions_end = since + limit if limit else None
+    cases_end = cases_offset + cases_limit if cases_limit else None
+    page = test_run.model_copy(update={
+        "actions": test_run.actions[since:actions_end],
+        "cases": test_run.cases[cases_offset:cases_end],
+        "queue_position": queue_position,
+    })
+    
+    content = page.model_dump(mode="json", include=_field_set(fields), exclude=_exclude_spec(exclude))
+    content["actions_total"] = len(test_run.actions)
+    content["cases_total"] = len(test_run.cases)
+    content["next_since"] = since + len(page.actions)
+    return JSONResponse(content, headers=headers)
+
+def _field_set(fields: Optional[str]) -> Optional[set[str]]:
+    if not fields:
+        return None
+    return {f.strip() for f in fields.split(",") if f.strip()}
+
+def _exclude_spec(exclude: Optional[str]) -> Optional[dict]:
+    # "actions.screenshot" -> {"actions": {"__all__": {"screenshot"}}}
+    if not exclude:
+        return None
+    spec: dict = {}
+    for item in exclude.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        if "." in item:
+            parent, child = item.split(".", 1)
+            if spec.get(parent) is not True:
+                spec.setdefault(parent, {"__all__": set()})["__all__"].add(child)
+        else:
+            spec[item] = True
+    return spec
+
+@router.delete("/{test_id}", response_model=TestResponse)
+async def cancel_test(test_id: str):
+    """Cancel a queued or running test run."""
     test_run = store.get(test_id)
     if not test_run:
         raise HTTPException(status_code=404, detail="Test not found")
-    return test_run
+    # Batch focuses only reach the queue once their batch's setup is done
+    if not dispatch.queue.cancel(test_id) and not cancel_waiting(test_id):
+        raise HTTPException(status_code=409, detail=f"Test is already {test_run.status}")
+    return TestResponse(id=test_id, status="cancelled")
 
 @router.get("/{test_id}/cases")
-async def get_test_cases(test_id: str):
+async def get_test_cases(test_id: str, offset: int = Query(0, ge=0), limit: Optional[int] = Query(None, ge=1)):
     """Get generated test cases."""
     test_run = store.get(test_id)
     if not test_run:
         raise HTTPException(status_code=404, detail="Test not found")
-    return {"test_id": test_id, "cases": test_run.cases}
+    end = offset + limit if limit else None
+    return {"test_id": test_id, "cases": test_run.cases[offset:end], "total": len(test_run.cases)}
 
+@router.get("/{test_id}/screenshots/{screenshot_hash}")
+async def get_screenshot(test_id: str, screenshot_hash: str):
+    """Stream a screenshot recorded by this test run."""
+    test_run = store.get(test_id)
+    if not test_run:
+        raise HTTPException(status_code=404, detail="Test not found")
+    
+    refs = {a.screenshot for a in test_run.actions} | {c.screenshot for c in test_run.cases}
+    path = blob_store.path(screenshot_hash) if screenshot_hash in refs else None
+    if not path:
+        raise HTTPException(status_code=404, detail="Screenshot not found")
+    
+    # Blobs are content-addressed, so they never change once written
+    return FileResponse(
+        path,
+        media_type=blob_store.content_type(path),
+        headers={
+            "Cache-Control": "public, max-age=31536000, immutable",
+            "ETag": f'"{screenshot_hash}"',
+        },
+    )
+
+
+@router.get("/{test_id}/export")
+async def export_test(test_id: str):
+    """Stream a zip of the run's screenshots, a JSON manifest and its Playwright trace, if recorded."""
+    test_run = store.get(test_id)
+    if not test_run:
+        raise HTTPException(status_code=404, detail="Test not found")
+    
+    # A sync iterator, so the archive is written in the threadpool as the client reads it
+    return StreamingResponse(
+        export_archive(test_run),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{test_id}.zip"'},
+    )
@@ -1,19 +1,36 @@
-import base64
 import json
+import time
 import asyncio
 from datetime import datetime
+import os
 from nanoid import generate
-from playwright.sync_api import sync_playwright
-from google import genai
+from pydantic import BaseModel, ValidationError
 
-from app.models import Action, TestCase
+from app.models import Action, TestCase, Decision, ScreenshotDecision
 from app.store import store
-from app.services.gemini import GEMINI_API_KEY
+from app.services.gemini import GEMINI_MODEL, get_client, prompt_config, estimate_tokens
+from app.services.browser_pool import browser_pool
+from app.services.screenshots import capture, persist, diff_frames
+from app.services.trajectory import TrajectoryRecorder, TrajectoryReplayer, hamming
+from app.services.metrics import Tracer
+from app.services import settle
+from app.services.resource_cache import resource_cache
+from app.services.export import PLAYWRIGHT_TRACE, record_trace
+from app.services.observe import OBSERVATION_MODE, ELEMENT_TIMEOUT_MS, take_snapshot, element_locator
+from app.services.settle import wait_for_settle, SETTLE_TIMEOUT_MS, NAVIGATION_TIMEOUT_MS
 
 # Screen dimensions
 SCREEN_WIDTH = 1440
 SCREEN_HEIGHT = 900
 
+# Agent limits
+AGENT_TURN_LIMIT = int(os.getenv("AGENT_TURN_LIMIT", "5"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+DECISION_REPAIR_ATTEMPTS = int(os.getenv("DECISION_REPAIR_ATTEMPTS", "1"))
+PLAN_MAX_STEPS = int(os.getenv("PLAN_MAX_STEPS", "4"))
+# Bits of the 64-bit screen hash a planned step may change before the rest of the plan is dropped
+PLAN_DIFF_THRESHOLD = int(os.getenv("PLAN_DIFF_THRESHOLD", "12"))
+
 SYSTEM_PROMPT = """You are a web automation agent that analyzes screenshots and decides what actions to take to complete a test.
 
 Available actions (action_name variable):
@@ -32,124 +49,157 @@ Respond with JSON only:
   "observation": "What you see in the screenshot and current state",
   "reasoning": "Why you're taking this action",
   "action": "action_name",
-  "args": {action arguments}
+  "args": {action arguments},
+  "plan": [{"action": "action_name", "args": {action arguments}}]
 }
 
-Coordinates are normalized 0-999 for both x and y regardless of actual screen size."""
+"plan" is optional: further actions to run right after "action" when you can predict them without seeing the screen again, such as filling in the remaining fields of a form and submitting it. The plan cannot contain "done". It stops early and you are asked again if a step fails, changes the URL, or changes the screen more than expected, so put anything that depends on a reaction of the page in a later turn.
+
+Coordinates are normalized 0-999 for both x and y regardless of actual screen size.""" + f"""
+Plans hold at most {PLAN_MAX_STEPS} steps."""
+
+# Added in "dom" observation mode, where each turn lists the page's interactive elements
+DOM_SYSTEM_PROMPT = SYSTEM_PROMPT + """
+
+Each turn also lists the page's interactive elements as `[index] kind "label"`. Target them by index with these actions, preferring them over coordinates:
+- click_element: Click a listed element. Args: {"index": int}
+- type_into_element: Type into a listed element. Args: {"index": int, "text": "string", "press_enter": bool, "clear_before_typing": bool}
+
+A screenshot is attached only when the list alone is ambiguous. Use coordinate actions only when no listed element fits."""
+
+# Steps expected to change the screen; they are not held to the visual checkpoint
+PLAN_MOVING_ACTIONS = {"scroll_document", "wait_5_seconds"}
 
-async def run_agent(test_id: str, url: str, focus: str, sio) -> None:
-    """Main agent that uses Gemini to analyze screenshots and control browser via Playwright."""
-    # Run the blocking Playwright code in a thread pool to avoid blocking the event loop
-    loop = asyncio.get_event_loop()
-    await loop.run_in_executor(None, _run_agent_sync, test_id, url, focus, sio, loop)
+async def run_agent(
+    test_id: str,
+    url: str,
+    focus: str,
+    events,
+    replay: bool = False,
+    settle_timeout_ms: int = SETTLE_TIMEOUT_MS,
+    navigation_timeout_ms: int = NAVIGATION_TIMEOUT_MS,
+    storage_state: dict | None = None,
+    save_storage_state: bool = False,
+    observation_mode: str = OBSERVATION_MODE,
+    trace: bool = PLAYWRIGHT_TRACE,
+    case: TestCase | None = None,
+    turn_limit: int = AGENT_TURN_LIMIT,
+    tracer: Tracer | None = None,
+    usage: dict | None = None,
+) -> dict | None:
+    """Main agent that uses Gemini to analyze screenshots and control browser via Playwright.
 
-def _run_agent_sync(test_id: str, url: str, focus: str, sio, loop) -> None:
-    """Synchronous version of the agent that runs in a thread."""
+    With `replay`, decisions recorded by an earlier run of the same url and focus
+    are executed directly, and the model is only consulted once the screen
+    drifts away from the recording.
+
+    The context starts from `storage_state` if given. With `save_storage_state`,
+    a successful run returns a session snapshot (final URL and storage state).
+
+    In the "dom" `observation_mode` the model reads an indexed list of the
+    page's interactive elements and only gets the screenshot when that list
+    is ambiguous.
+
+    With `trace`, a Playwright trace of the run is saved for its export bundle.
+
+    With a `case`, this is one of several concurrent explorations of the run:
+    its actions are tagged with the case, its outcome goes to the case instead
+    of the run's status, and the caller owns `tracer` and the shared `usage`.
+    """
     page = None
-    browser = None
+    snapshot = None
+    tracer = tracer or Tracer()
+    publisher = ActionPublisher(test_id, events, tracer, case_id=case.id if case else None)
+    usage = usage if usage is not None else {"parse_failures": 0, "wasted_calls": 0}
     
     try:
         # Get the test run from store
         test_run = store.get(test_id)
         if not test_run:
             raise ValueError(f"Test run {test_id} not found")
+        if case is None:
+            store.update(test_id, spans=list(tracer.spans))
         
-        # Initialize Playwright with sync API
-        with sync_playwright() as playwright:
-            browser = playwright.chromium.launch(headless=True)
-            context = browser.new_context(viewport={"width": SCREEN_WIDTH, "height": SCREEN_HEIGHT})
-            page = context.new_page()
+        # Borrow a fresh context from a warm pooled browser
+        tracer.turn = 0
+        acquire_started = time.perf_counter()
+        async with browser_pool.context(
+            viewport={"width": SCREEN_WIDTH, "height": SCREEN_HEIGHT},
+            storage_state=storage_state,
+        ) as context, record_trace(context, test_id, trace):
+            await settle.install(context)
+            await resource_cache.install(context)
+            page = await context.new_page()
+            tracer.record("browser_launch", time.perf_counter() - acquire_started)
             
-            # Navigate to URL
-            page.goto(url, wait_until="networkidle")
+            # Navigate to URL and wait until the page is actually stable
+            with tracer.span("navigation"):
+                await page.goto(url, wait_until="domcontentloaded", timeout=navigation_timeout_ms)
+            with tracer.span("settle"):
+                settle_ms = await wait_for_settle(page, navigation_timeout_ms)
             
-            # Take initial screenshot after navigation
-            initial_screenshot = page.screenshot(type="png")
-            initial_screenshot_b64 = base64.b64encode(initial_screenshot).decode('utf-8')
+            # Take initial screenshot after navigation; it is also the first turn's model input
+            frame = await capture_traced(page, tracer)
             
-            # Log initial navigation action
-            action = Action(
-                type="navigate",
-                element=url,
-                screenshot=initial_screenshot_b64,
-                timestamp=datetime.now()
-            )
-            store.add_action(test_id, action)
-            asyncio.run_coroutine_threadsafe(
-                sio.emit('action', action.model_dump(), room=test_id),
-                loop
-            )
+            # Log initial navigation action; it is published while the first decision is requested
+            publisher.publish(frame, type="navigate", element=url, settle_ms=settle_ms)
             
-            # Get Gemini client
-            client = genai.Client(api_key=GEMINI_API_KEY)
+            # Every run records its decisions so later runs can replay them
+            recorder = TrajectoryRecorder(url, focus)
+            replayer = TrajectoryReplayer.load(url, focus) if replay else None
+            if replay and replayer is None:
+                print(f"No trajectory recorded for {url}, running with the model")
+            # Trajectories are shared across observation modes; element actions only replay in dom mode
+            replay_schema = Decision if observation_mode == "dom" else ScreenshotDecision
             
-            # Agent loop - max 5 turns
-            turn_limit = 5
+            # Agent loop
             conversation_history = []
             test_completed = False
+            outcome = (False, "Test reached maximum turn limit")
+            # Last frame the model was shown; later captures are diffed against it
+            seen = None
             
             for i in range(turn_limit):
                 print(f"Turn {i+1}/{turn_limit}")
+                tracer.turn = i + 1
+                if case is None:
+                    store.update(test_id, spans=list(tracer.spans), **usage)
                 
-                # Take screenshot
-                screenshot_bytes = page.screenshot(type="png")
-                screenshot_b64 = base64.b64encode(screenshot_bytes).decode('utf-8')
-                
-                # Build prompt for this turn
-                if i == 0:
-                    prompt = f"""Task: {focus}
-Current URL: {url}
-
-Analyze the screenshot and decide the first action to take to complete this test."""
-                else:
-                    # Build history summary
-                    history_text = "\n".join([
-                        f"- {h['action']}: {h['args']}" 
-                        for h in conversation_history
-                    ])
-                    print(f"Conversation history: {conversation_history}")
-                    
-                    prompt = f"""Task: {focus}
-Current URL: {page.url}
-
-Previous actions taken:
-{history_text}
-
-Analyze the screenshot and decide the next action. If the test is complete, use the 'done' action. Do not repeat actions you have already taken unless absolutely necessary."""
-                
-                # Send request to Gemini
-                response = client.models.generate_content(
-                    model='gemini-2.5-flash',
-                    contents=[
-                        {"role": "user", "parts": [
-                            {"text": SYSTEM_PROMPT},
-                        ]},
-                        {"role": "user", "parts": [
-                            {"text": prompt},
-                            {"inline_data": {"mime_type": "image/png", "data": screenshot_b64}}
-                        ]}
-                    ]
-                )
-                
-                # Parse response
-                response_text = response.text.strip()
-                print(f"Model response: {response_text}")
+                # Indexing the elements also re-stamps the indexes element actions resolve to
+                observed = None
+                if observation_mode == "dom":
+                    with tracer.span("snapshot"):
+                        observed = await take_snapshot(page)
                 
-                # Extract JSON from response
-                decision = parse_json_response(response_text)
+                # Replay the recorded decision while the screen still matches the recording
+                recorded = replayer.next(frame.phash) if replayer else None
+                decision = None
+                if recorded:
+                    try:
+                        decision = replay_schema.model_validate(recorded)
+                    except ValidationError as e:
+                        print(f"Recorded step does not fit this run ({e.error_count()} errors), falling back to the model")
+                        replayer.drifted = True
+                replayed = decision is not None
+                if not replayed:
+                    decision = await request_decision(focus, url, page.url, conversation_history, frame, tracer, usage, observed)
+                    if observed is None or observed.ambiguous:
+                        seen = frame
                 
                 if not decision:
-                    print("Failed to parse model response, retrying...")
+                    print("Model response could not be repaired, moving on to the next turn")
                     continue
                 
                 # Log observation
-                observation = decision.get("observation", "")
-                reasoning = decision.get("reasoning", "")
+                observation = decision.observation
+                reasoning = decision.reasoning
                 print(f"Observation: {observation}")
                 print(f"Reasoning: {reasoning}")
                 
-                action_name = decision.get("action", "")
-                args = decision.get("args", {})
+                action_name = decision.action
+                decision_dict = decision.as_dict()
+                args = decision_dict["args"]
+                recorder.record(decision_dict, frame.phash)
                 
                 # Check if done
                 if action_name == "done":
@@ -157,101 +207,109 @@ Analyze the screenshot and decide the next action. If the test is complete, use
                     message = args.get("message", "Test completed")
                     print(f"Test {'passed' if success else 'failed'}: {message}")
                     
-                    # Take final screenshot
-                    final_screenshot = page.screenshot(type="png")
-                    final_screenshot_b64 = base64.b64encode(final_screenshot).decode('utf-8')
-                    
+                    # Nothing ran since the last capture, so it is the final screenshot
                     # Log the done action with reasoning
-                    action = Action(
-                        type="done",
-                        element=message,
-                        reasoning=reasoning,
-                        screenshot=final_screenshot_b64,
-                        timestamp=datetime.now()
-                    )
-                    store.add_action(test_id, action)
-                    
-                    # Emit with model_dump to ensure proper serialization
-                    action_dict = action.model_dump()
-                    print(f"Emitting done action: {action_dict.get('type')}, reasoning: {action_dict.get('reasoning')[:50] if action_dict.get('reasoning') else 'None'}...")
-                    asyncio.run_coroutine_threadsafe(
-                        sio.emit('action', action_dict, room=test_id),
-                        loop
-                    )
+                    print(f"Emitting done action, reasoning: {reasoning[:50] if reasoning else 'None'}...")
+                    publisher.publish(frame, type="done", element=message, reasoning=reasoning, replayed=replayed)
+                    recorder.save()
                     test_completed = True
+                    outcome = (success, message)
                     break
                 
-                # Execute the action
-                result = execute_single_action(action_name, args, page, SCREEN_WIDTH, SCREEN_HEIGHT)
-                
-                # Take screenshot after action
-                action_screenshot = page.screenshot(type="png")
-                action_screenshot_b64 = base64.b64encode(action_screenshot).decode('utf-8')
-                
-                # Log action
-                action = Action(
-                    type=action_name,
-                    element=result.get('element', ''),
-                    reasoning=reasoning,
-                    screenshot=action_screenshot_b64,
-                    timestamp=datetime.now()
-                )
-                store.add_action(test_id, action)
-                asyncio.run_coroutine_threadsafe(
-                    sio.emit('action', action.model_dump(), room=test_id),
-                    loop
-                )
-                
-                # Update conversation history
-                conversation_history.append({
-                    "action": action_name,
-                    "args": args,
-                    "observation": observation,
-                    "result": result
-                })
+                # Run the action and any planned follow-ups back to back
+                steps = [(action_name, args)] + [(step["action"], step["args"]) for step in decision_dict["plan"][:PLAN_MAX_STEPS]]
+                for j, (step_name, step_args) in enumerate(steps):
+                    url_before, frame_before = page.url, frame
+                    
+                    # Execute the action; it reports its settle time separately
+                    action_started = time.perf_counter()
+                    result = await execute_single_action(
+                        step_name, step_args, page, SCREEN_WIDTH, SCREEN_HEIGHT,
+                        settle_timeout_ms=settle_timeout_ms,
+                        navigation_timeout_ms=navigation_timeout_ms,
+                        observed=observed,
+                    )
+                    settle_seconds = (result.get('settle_ms') or 0) / 1000
+                    tracer.record("action", time.perf_counter() - action_started - settle_seconds)
+                    tracer.record("settle", settle_seconds)
+                    
+                    # Take screenshot after action; it is reused as the next turn's model input
+                    frame = await capture_traced(page, tracer, reference=seen)
+                    step_diff = diff_frames(frame_before.small, frame.small)
+                    
+                    # Log action; storing and emitting it overlaps with the next model request
+                    publisher.publish(
+                        frame,
+                        type=step_name,
+                        element=result.get('element', ''),
+                        reasoning=reasoning if j == 0 else f"Planned step {j + 1} of {len(steps)}",
+                        replayed=replayed,
+                        settle_ms=result.get('settle_ms'),
+                        diff_score=step_diff.score,
+                    )
+                    
+                    # Update conversation history
+                    conversation_history.append({
+                        "action": step_name,
+                        "args": step_args,
+                        "observation": observation,
+                        "result": result
+                    })
+                    if step_diff.noop:
+                        conversation_history[-1]["note"] = "no visible effect"
+                    
+                    # Hand back to the model as soon as the plan's assumptions no longer hold
+                    if j < len(steps) - 1:
+                        reason = plan_checkpoint(step_name, result, url_before, page.url, frame_before, frame)
+                        if reason:
+                            skipped = len(steps) - 1 - j
+                            print(f"Plan stopped after step {j + 1}: {reason}")
+                            note = f"{skipped} planned steps skipped: {reason}"
+                            if step_diff.noop:
+                                note = f"no visible effect, {note}"
+                            conversation_history[-1]["note"] = note
+                            break
             
             # If test reached turn limit without completing, log a timeout action
             if not test_completed:
-                timeout_screenshot = page.screenshot(type="png")
-                timeout_screenshot_b64 = base64.b64encode(timeout_screenshot).decode('utf-8')
-                
-                timeout_action = Action(
+                print("Emitting timeout action")
+                publisher.publish(
+                    frame,
                     type="done",
                     element="Test reached maximum turn limit",
                     reasoning=f"The test did not complete within {turn_limit} turns. The agent may need more steps or encountered an issue.",
-                    screenshot=timeout_screenshot_b64,
-                    timestamp=datetime.now()
-                )
-                store.add_action(test_id, timeout_action)
-                
-                # Emit with proper serialization
-                timeout_dict = timeout_action.model_dump()
-                print(f"Emitting timeout action: {timeout_dict.get('type')}")
-                asyncio.run_coroutine_threadsafe(
-                    sio.emit('action', timeout_dict, room=test_id),
-                    loop
                 )
             
-            browser.close()
+            await publisher.drain()
+            
+            if save_storage_state:
+                snapshot = {"url": page.url, "storage_state": await context.storage_state()}
+        
+        if case is not None:
+            await finish_case(test_id, case.id, events, *outcome, screenshot=await persist(frame))
+            return snapshot
         
         # Mark test as complete
-        store.update(test_id, status="complete", completed_at=datetime.now())
-        asyncio.run_coroutine_threadsafe(
-            sio.emit('complete', {"test_completed": True}, room=test_id),
-            loop
-        )
+        store.update(test_id, status="complete", completed_at=datetime.now(), spans=list(tracer.spans), **usage)
+        await events.emit('complete', {"test_completed": True}, room=test_id)
+        return snapshot
         
     except Exception as e:
         print(f"Agent error: {str(e)}")
         import traceback
         traceback.print_exc()
         
+        # Let actions already published land before the error action
+        try:
+            await publisher.drain()
+        except Exception as publish_error:
+            print(f"Could not publish pending actions: {publish_error}")
+        
         # Try to capture error screenshot if browser is still available
-        error_screenshot_b64 = None
+        error_screenshot_ref = None
         if page is not None:
             try:
-                error_screenshot = page.screenshot(type="png")
-                error_screenshot_b64 = base64.b64encode(error_screenshot).decode('utf-8')
+                error_screenshot_ref = await persist(await capture(page))
                 print("Successfully captured error screenshot")
             except Exception as screenshot_error:
                 print(f"Could not capture error screenshot: {screenshot_error}")
@@ -264,40 +322,252 @@ Analyze the screenshot and decide the next action. If the test is complete, use
                 type="done",
                 element="Test failed with error",
                 reasoning=f"An error occurred during test execution: {str(e)}",
-                screenshot=error_screenshot_b64,
+                screenshot=error_screenshot_ref,
+                case_id=case.id if case else None,
                 timestamp=datetime.now()
             )
             store.add_action(test_id, error_action)
             print(f"Added error action to store for test {test_id}")
             
-            # Emit the action via Socket.IO with proper serialization
-            error_dict = error_action.model_dump()
-            print(f"Emitting error action dict: type={error_dict.get('type')}, element={error_dict.get('element')}")
-            asyncio.run_coroutine_threadsafe(
-                sio.emit('action', error_dict, room=test_id),
-                loop
-            )
+            # Emit the action via Socket.IO
+            print(f"Emitting error action: element={error_action.element}")
+            await events.emit_action(test_id, error_action)
             print(f"Emitted error action via Socket.IO to room {test_id}")
         except Exception as action_error:
             print(f"Failed to create/emit error action: {action_error}")
             traceback.print_exc()
         
+        if case is not None:
+            await finish_case(test_id, case.id, events, False, f"Error: {e}", screenshot=error_screenshot_ref)
+            return None
+        
         # Update status to failed
         try:
-            store.update(test_id, status="failed")
+            store.update(test_id, status="failed", spans=list(tracer.spans), **usage)
             print(f"Updated test {test_id} status to failed")
         except Exception as update_error:
             print(f"Failed to update status: {update_error}")
         
         # Emit error event
         try:
-            asyncio.run_coroutine_threadsafe(
-                sio.emit('error', {"message": str(e)}, room=test_id),
-                loop
-            )
+            await events.emit('error', {"message": str(e)}, room=test_id)
             print(f"Emitted error event via Socket.IO to room {test_id}")
         except Exception as emit_error:
             print(f"Failed to emit error event: {emit_error}")
+    finally:
+        # A cancelled run leaves nothing behind
+        publisher.cancel()
+
+async def capture_traced(page, tracer: Tracer, reference=None):
+    """Capture a frame and record its capture and encoding spans."""
+    frame = await capture(page, reference)
+    tracer.record("screenshot", frame.capture_seconds)
+    tracer.record("encode", frame.encode_seconds)
+    return frame
+
+async def finish_case(test_id: str, case_id: str, events, success: bool, actual: str, screenshot: str | None = None) -> None:
+    """Record a case's outcome and announce it to the run's room."""
+    status = "pass" if success else "fail"
+    store.update_case(test_id, case_id, status=status, actual=actual, screenshot=screenshot)
+    await events.emit('case', {"id": case_id, "status": status, "actual": actual, "screenshot": screenshot}, room=test_id)
+
+class ActionPublisher:
+    """Persists, stores and emits a run's actions in order, off the turn's critical path.
+
+    Each published action becomes a task chained after the previous one, so
+    the UI encoding and blob write of step N overlap with the model request
+    for step N+1 while the store and clients still see actions in order.
+    """
+    def __init__(self, test_id: str, events, tracer: Tracer, case_id: str | None = None):
+        self.test_id = test_id
+        self.events = events
+        self.tracer = tracer
+        self.case_id = case_id
+        self._last: asyncio.Task | None = None
+
+    def publish(self, frame, **fields) -> None:
+        fields.setdefault("timestamp", datetime.now())
+        self._last = asyncio.create_task(self._publish(self._last, frame, fields, self.tracer.turn))
+
+    async def drain(self) -> None:
+        """Wait until every published action has been stored and emitted."""
+        if self._last is not None:
+            await self._last
+
+    def cancel(self) -> None:
+        if self._last is not None:
+            self._last.cancel()
+
+    async def _publish(self, previous, frame, fields: dict, turn: int | None) -> None:
+        if previous is not None:
+            await previous
+        with self.tracer.span("persist", turn):
+            screenshot = await persist(frame)
+        action = Action(screenshot=screenshot, case_id=self.case_id, **fields)
+        store.add_action(self.test_id, action)
+        await self.events.emit_action(self.test_id, action, frame.ui_bytes)
+
+def screenshot_parts(frame) -> tuple[str | None, list[bytes]]:
+    """Images to send for `frame`, and a note on how it differs from the last screenshot the model saw.
+
+    Requests are stateless and never carry the previous screenshot, so the
+    full frame is always sent; the diff only goes into the note.
+    """
+    note = None
+    if frame.diff is not None and frame.diff.noop:
+        note = "The screen has not visibly changed since the last screenshot you were shown."
+    elif frame.region is not None:
+        left, top, right, bottom = frame.region
+        note = (f"Since the last screenshot you were shown, only the region from ({left}, {top}) "
+                f"to ({right}, {bottom}) in screen coordinates has changed.")
+    return note, [frame.model_bytes]
+
+async def request_decision(focus: str, url: str, current_url: str, conversation_history: list[dict], frame, tracer: Tracer, usage: dict, observed=None) -> Decision | None:
+    """Ask Gemini for the next action given the current frame, or the element list `observed`.
+
+    The reply is constrained to the Decision schema, without the element
+    actions when observing screenshots. If it still does not
+    validate, it is sent back with the validation error for a text-only
+    repair, up to DECISION_REPAIR_ATTEMPTS times, within the same turn.
+    Invalid replies and discarded calls are counted in `usage`.
+    """
+    ambiguous = observed.ambiguous if observed is not None else None
+    send_screenshot = observed is None or ambiguous is not None
+    source = "screenshot" if observed is None else "page"
+    
+    # Build prompt for this turn
+    if not conversation_history:
+        prompt = f"""Task: {focus}
+Current URL: {url}
+
+Analyze the {source} and decide the first action to take to complete this test."""
+    else:
+        # Build history summary within the token budget
+        history_text = compact_history(conversation_history, HISTORY_TOKEN_BUDGET)
+        print(f"Conversation history: {len(conversation_history)} actions, ~{estimate_tokens(history_text)} tokens")
+        
+        prompt = f"""Task: {focus}
+Current URL: {current_url}
+
+Previous actions taken:
+{history_text}
+
+Analyze the {source} and decide the next action. If the test is complete, use the 'done' action. Do not repeat actions you have already taken unless absolutely necessary."""
+    
+    parts = [{"text": prompt}]
+    if observed is not None:
+        parts[0]["text"] += f"\n\n{observed.text()}"
+        if ambiguous:
+            parts[0]["text"] += f"\n\nA screenshot is attached because {ambiguous}."
+    if send_screenshot:
+        note, images = screenshot_parts(frame)
+        if note:
+            parts[0]["text"] += f"\n\n{note}"
+        parts.extend({"inline_data": {"mime_type": frame.model_mime, "data": data}} for data in images)
+    
+    # Send request to Gemini; the system prompt is sent via cached content
+    system_prompt = SYSTEM_PROMPT if observed is None else DOM_SYSTEM_PROMPT
+    # Element actions only resolve against a snapshot's indexes
+    schema = ScreenshotDecision if observed is None else Decision
+    config = await prompt_config(system_prompt, response_mime_type="application/json", response_schema=schema)
+    with tracer.span("gemini_request"):
+        response = await get_client().aio.models.generate_content(
+            model=GEMINI_MODEL,
+            config=config,
+            contents=[{"role": "user", "parts": parts}]
+        )
+    
+    # Parse response
+    response_text = (response.text or "").strip()
+    print(f"Model response: {response_text}")
+    
+    with tracer.span("json_parse"):
+        decision, error = parse_decision(response_text, usage, schema)
+    
+    # Re-ask without the screenshot
+    for _ in range(DECISION_REPAIR_ATTEMPTS):
+        if decision is not None:
+            break
+        usage["wasted_calls"] += 1
+        print(f"Invalid decision ({error}), asking the model to repair it")
+        response_text = await repair_reply(config, parts[0]["text"], response_text, error, tracer)
+        print(f"Repaired response: {response_text}")
+        with tracer.span("json_parse"):
+            decision, error = parse_decision(response_text, usage, schema)
+    
+    if decision is None:
+        usage["wasted_calls"] += 1
+    return decision
+
+async def repair_reply(config, prompt: str, reply: str, error: str, tracer: Tracer) -> str:
+    """Send an invalid `reply` to `prompt` back with its validation `error` and return the new reply.
+
+    The re-ask is text-only; the model only has to fix the format.
+    """
+    with tracer.span("gemini_repair"):
+        response = await get_client().aio.models.generate_content(
+            model=GEMINI_MODEL,
+            config=config,
+            contents=[
+                {"role": "user", "parts": [{"text": prompt}]},
+                {"role": "model", "parts": [{"text": reply or "(empty reply)"}]},
+                {"role": "user", "parts": [{"text": f"That reply is invalid: {error}. Reply again with only the corrected JSON."}]},
+            ]
+        )
+    return (response.text or "").strip()
+
+def parse_decision(text: str, usage: dict, schema: type[BaseModel] = Decision) -> tuple[BaseModel | None, str | None]:
+    """Validate a reply into `schema` (a Decision or CasePlan), or return why it does not fit.
+
+    Replies that miss the schema but contain a valid object wrapped in prose
+    or code fences are still accepted; they count as parse failures either way.
+    """
+    try:
+        return schema.model_validate_json(text), None
+    except ValidationError:
+        usage["parse_failures"] += 1
+    
+    data = parse_json_response(text)
+    if data is None:
+        return None, "the reply is not a JSON object"
+    try:
+        return schema.model_validate(data), None
+    except ValidationError as e:
+        return None, "; ".join(
+            f"{'.'.join(str(part) for part in err['loc']) or 'decision'}: {err['msg']}"
+            for err in e.errors()[:3]
+        )
+
+def compact_history(conversation_history: list[dict], budget: int) -> str:
+    """Render previous actions, newest first into the budget, eliding the oldest."""
+    lines = []
+    used = 0
+    for h in reversed(conversation_history):
+        line = f"- {h['action']}: {h['args']}"
+        if h.get("note"):
+            line += f" ({h['note']})"
+        cost = estimate_tokens(line)
+        if lines and used + cost > budget:
+            break
+        lines.append(line)
+        used += cost
+    
+    omitted = len(conversation_history) - len(lines)
+    if omitted:
+        lines.append(f"- ... {omitted} earlier actions omitted")
+    return "\n".join(reversed(lines))
+
+def plan_checkpoint(action_name: str, result: dict, url_before: str, url_after: str, frame_before, frame_after) -> str | None:
+    """Why the rest of a plan must not run after this step, or None if it may continue."""
+    if "error" in result:
+        return f"{action_name} failed: {result['error']}"
+    if url_after != url_before:
+        return f"the page changed to {url_after}"
+    if action_name not in PLAN_MOVING_ACTIONS:
+        distance = hamming(frame_before.phash, frame_after.phash)
+        if distance > PLAN_DIFF_THRESHOLD:
+            return f"the screen changed more than expected ({distance} bits)"
+    return None
 
 def parse_json_response(text: str) -> dict:
     """Extract and parse JSON from model response."""
@@ -332,20 +602,34 @@ def parse_json_response(text: str) -> dict:
     
     return None
 
-def execute_single_action(action_name: str, args: dict, page, screen_width: int, screen_height: int) -> dict:
-    """Execute a single action returned by the model."""
+async def execute_single_action(
+    action_name: str,
+    args: dict,
+    page,
+    screen_width: int,
+    screen_height: int,
+    settle_timeout_ms: int = SETTLE_TIMEOUT_MS,
+    navigation_timeout_ms: int = NAVIGATION_TIMEOUT_MS,
+    observed=None,
+) -> dict:
+    """Execute a single action returned by the model.
+
+    Element actions resolve their index to the element stamped by the last
+    snapshot, described with `observed` if given.
+    """
     action_result = {}
     print(f"  -> Executing: {action_name} with args: {args}")
     
     try:
         if action_name == "navigate":
             url = args.get("url", "")
-            page.goto(url, wait_until="networkidle")
+            await page.goto(url, wait_until="domcontentloaded", timeout=navigation_timeout_ms)
+            settle_timeout_ms = navigation_timeout_ms
             action_result = {"element": url}
         elif action_name == "click_at":
             actual_x = denormalize_x(args["x"], screen_width)
             actual_y = denormalize_y(args["y"], screen_height)
-            page.mouse.click(actual_x, actual_y)
+            await page.mouse.click(actual_x, actual_y)
             action_result = {"element": f"({actual_x}, {actual_y})"}
         elif action_name == "type_text_at":
             actual_x = denormalize_x(args["x"], screen_width)
@@ -354,45 +638,61 @@ def execute_single_action(action_name: str, args: dict, page, screen_width: int,
             press_enter = args.get("press_enter", False)
             clear_before_typing = args.get("clear_before_typing", True)
             
-            page.mouse.click(actual_x, actual_y)
+            await page.mouse.click(actual_x, actual_y)
             if clear_before_typing:
-                page.keyboard.press("Control+A")
-                page.keyboard.press("Backspace")
-            page.keyboard.type(text)
+                await page.keyboard.press("Control+A")
+                await page.keyboard.press("Backspace")
+            await page.keyboard.type(text)
             if press_enter:
-                page.keyboard.press("Enter")
+                await page.keyboard.press("Enter")
+            action_result = {"element": text}
+        elif action_name == "click_element":
+            index = args["index"]
+            await element_locator(page, index).click(timeout=ELEMENT_TIMEOUT_MS)
+            action_result = {"element": observed.describe(index) if observed else f"[{index}]"}
+        elif action_name == "type_into_element":
+            index = args["index"]
+            text = args["text"]
+            locator = element_locator(page, index)
+            if args.get("clear_before_typing", True):
+                await locator.fill(text, timeout=ELEMENT_TIMEOUT_MS)
+            else:
+                await locator.click(timeout=ELEMENT_TIMEOUT_MS)
+                await page.keyboard.type(text)
+            if args.get("press_enter", False):
+                await locator.press("Enter", timeout=ELEMENT_TIMEOUT_MS)
             action_result = {"element": text}
         elif action_name == "scroll_document":
             direction = args["direction"]
             if direction == "down":
-                page.mouse.wheel(0, 500)
+                await page.mouse.wheel(0, 500)
             elif direction == "up":
-                page.mouse.wheel(0, -500)
+                await page.mouse.wheel(0, -500)
             elif direction == "left":
-                page.mouse.wheel(-500, 0)
+                await page.mouse.wheel(-500, 0)
             elif direction == "right":
-                page.mouse.wheel(500, 0)
+                await page.mouse.wheel(500, 0)
             action_result = {"element": direction}
         elif action_name == "go_back":
-            page.go_back()
+            await page.go_back()
             action_result = {"element": "back"}
         elif action_name == "go_forward":
-            page.go_forward()
+            await page.go_forward()
             action_result = {"element": "forward"}
         elif action_name == "wait_5_seconds":
-            page.wait_for_timeout(5000)
+            # Waiting is only useful until the page stops changing
+            settle_timeout_ms = 5000
             action_result = {"element": "wait"}
         elif action_name == "key_combination":
             keys = args["keys"]
-            page.keyboard.press(keys)
+            await page.keyboard.press(keys)
             action_result = {"element": keys}
         else:
             print(f"Warning: Unknown action {action_name}")
             action_result = {"element": action_name}
         
         # Wait for page to settle
-        page.wait_for_load_state("networkidle", timeout=5000)
-        page.wait_for_timeout(1000)
+        action_result["settle_ms"] = await wait_for_settle(page, settle_timeout_ms)
         
     except Exception as e:
         print(f"Error executing {action_name}: {e}")
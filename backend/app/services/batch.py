@@ -0,0 +1,116 @@
+import asyncio
+from datetime import datetime
+
+from app.store import store
+from app.socketio import broadcaster
+from app.services.agent import run_agent, SCREEN_WIDTH, SCREEN_HEIGHT
+from app.services.browser_pool import browser_pool
+from app.services.scheduler import QueueFull
+from app.services import dispatch
+from app.services import settle
+from app.services.resource_cache import resource_cache
+from app.services.settle import wait_for_settle, NAVIGATION_TIMEOUT_MS
+
+async def run_batch(batch_id: str, events, priority: str = "normal", **run_options) -> None:
+    """Prepare a shared session once, then fan the batch's focuses out as separate runs.
+
+    The setup navigates to the batch URL (running the optional setup focus as its
+    own test run) and snapshots the context's storage state. Each focus then runs
+    in its own context seeded from that snapshot, starting at the URL the setup
+    ended on.
+    """
+    batch = store.get_batch(batch_id)
+    if not batch:
+        raise ValueError(f"Batch {batch_id} not found")
+
+    navigation_timeout_ms = run_options.get("navigation_timeout_ms", NAVIGATION_TIMEOUT_MS)
+    try:
+        if batch.setup_test_id:
+            snapshot = await run_agent(
+                batch.setup_test_id, batch.url, batch.setup_focus, events,
+                save_storage_state=True,
+                **run_options,
+            )
+        else:
+            snapshot = await snapshot_session(batch.url, navigation_timeout_ms)
+    except asyncio.CancelledError:
+        # The setup was cancelled or hit its deadline; none of the focuses will start
+        for test_id in batch.test_ids:
+            store.update(test_id, status="cancelled", completed_at=datetime.now())
+        store.update_batch(batch_id, status="running")
+        raise
+
+    if snapshot is None:
+        print(f"Batch {batch_id}: setup failed, focuses will start from a cold session")
+        snapshot = {"url": batch.url, "storage_state": None}
+
+    store.update_batch(batch_id, status="running")
+    for test_id, focus in zip(batch.test_ids, batch.focuses):
+        # Focuses cancelled while the setup ran are not started
+        run = store.get(test_id)
+        if run is None or run.status == "cancelled":
+            continue
+        try:
+            dispatch.submit(
+                test_id,
+                "run",
+                {"url": snapshot["url"], "focus": focus, "storage_state": snapshot["storage_state"], **run_options},
+                priority=priority,
+            )
+        except QueueFull as e:
+            print(f"Batch {batch_id}: could not queue {test_id}: {e}")
+            store.update(test_id, status="failed", completed_at=datetime.now())
+
+async def snapshot_session(url: str, navigation_timeout_ms: int = NAVIGATION_TIMEOUT_MS) -> dict | None:
+    """Navigate to `url` in a fresh context and return its final URL and storage state."""
+    try:
+        async with browser_pool.context(viewport={"width": SCREEN_WIDTH, "height": SCREEN_HEIGHT}) as context:
+            await settle.install(context)
+            await resource_cache.install(context)
+            page = await context.new_page()
+            await page.goto(url, wait_until="domcontentloaded", timeout=navigation_timeout_ms)
+            await wait_for_settle(page, navigation_timeout_ms)
+            return {"url": page.url, "storage_state": await context.storage_state()}
+    except Exception as e:
+        print(f"Could not snapshot session for {url}: {e}")
+        return None
+
+def cancel_waiting(test_id: str) -> bool:
+    """Cancel a focus that is waiting for its batch's setup, before it reaches the queue."""
+    run = store.get(test_id)
+    if run is None or run.status != "queued":
+        return False
+    store.update(test_id, status="cancelled", completed_at=datetime.now())
+    broadcaster.emit_status(test_id, status="cancelled")
+    return True
+
+def cancel_batch(batch) -> bool:
+    """Cancel the batch's setup job and every focus not yet finished. Returns False if nothing was left to cancel."""
+    # The setup job is queued under the setup run, or under the batch id without one
+    cancelled = dispatch.queue.cancel(batch.setup_test_id or batch.id)
+    for test_id in batch.test_ids:
+        if dispatch.queue.cancel(test_id) or cancel_waiting(test_id):
+            cancelled = True
+    if batch.status == "setup":
+        store.update_batch(batch.id, status="running")
+    return cancelled
+
+def batch_status(batch) -> dict:
+    """Aggregate the status of a batch's runs."""
+    counts: dict[str, int] = {}
+    for test_id in batch.test_ids:
+        run = store.get(test_id)
+        status = run.status if run else "missing"
+        counts[status] = counts.get(status, 0) + 1
+
+    if batch.status == "setup":
+        status = "setup"
+    elif counts.get("queued") or counts.get("running"):
+        status = "running"
+    elif counts.get("complete") == len(batch.test_ids):
+        status = "complete"
+    elif counts.get("cancelled") == len(batch.test_ids):
+        status = "cancelled"
+    else:
+        status = "failed"
+    return {"status": status, "counts": counts}
@@ -0,0 +1,68 @@
+import os
+import re
+import hashlib
+import tempfile
+from pathlib import Path
+
+# Screenshots are stored on local disk, named by the SHA-256 of their content
+BLOB_DIR = Path(os.getenv("BLOB_DIR", "data/blobs"))
+
+_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+]
+
+class BlobStore:
+    """Content-addressed blob store; identical content is written once and shared across runs."""
+    def __init__(self, root: Path = BLOB_DIR):
+        self.root = Path(root)
+
+    def put(self, data: bytes) -> str:
+        """Write `data` if it is not already stored and return its hash."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if path.exists():
+            return digest
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a uniquely named temp file and rename so readers never see a partial blob
+        # and concurrent writers of the same content don't share a temp file
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f"{digest}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            # Losing a race to a writer of the same content is fine
+            if not path.exists():
+                raise
+        return digest
+
+    def path(self, digest: str) -> Path | None:
+        """Return the file holding `digest`, or None if it is unknown."""
+        if not _HASH_RE.match(digest):
+            return None
+        path = self._path(digest)
+        return path if path.exists() else None
+
+    def content_type(self, path: Path) -> str:
+        """Sniff the stored media type from the blob's leading bytes."""
+        with open(path, "rb") as f:
+            head = f.read(12)
+        if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+            return "image/webp"
+        for signature, media_type in _SIGNATURES:
+            if head.startswith(signature):
+                return media_type
+        return "application/octet-stream"
+
+    def _path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest
+
+blob_store = BlobStore()
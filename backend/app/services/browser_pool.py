@@ -0,0 +1,165 @@
+import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from playwright.async_api import async_playwright
+
+# Pool configuration
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "4"))
+BROWSER_MAX_CONTEXTS = int(os.getenv("BROWSER_MAX_CONTEXTS", "50"))
+BROWSER_CONTEXTS_PER_BROWSER = int(os.getenv("BROWSER_CONTEXTS_PER_BROWSER", "8"))
+
+class _PooledBrowser:
+    """A warm browser and its lease counters."""
+    def __init__(self):
+        self.browser = None
+        self.active = 0
+        self.served = 0
+        self.crashed = False
+
+class BrowserPool:
+    """Size-bounded pool of warm Chromium browsers that hands out a fresh context per run.
+
+    Each browser serves up to `contexts_per_browser` concurrent contexts and is
+    recycled once it has served `max_contexts` of them or has crashed.
+    """
+    def __init__(
+        self,
+        size: int = BROWSER_POOL_SIZE,
+        max_contexts: int = BROWSER_MAX_CONTEXTS,
+        contexts_per_browser: int = BROWSER_CONTEXTS_PER_BROWSER,
+    ):
+        self.size = size
+        self.max_contexts = max_contexts
+        self.contexts_per_browser = contexts_per_browser
+        self._playwright = None
+        self._browsers: list[_PooledBrowser] = []
+        self._cond = asyncio.Condition()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "recycled": 0,
+            "crashed": 0,
+            "waiting": 0,
+            "in_use": 0,
+            "wait_count": 0,
+            "wait_total": 0.0,
+            "wait_max": 0.0,
+        }
+
+    @asynccontextmanager
+    async def context(self, **options):
+        """Yield a fresh isolated BrowserContext on a warm browser, waiting for capacity if needed."""
+        submitted = time.monotonic()
+        self._stats["waiting"] += 1
+        try:
+            entry = await self._acquire()
+        finally:
+            self._stats["waiting"] -= 1
+        waited = time.monotonic() - submitted
+        self._stats["wait_count"] += 1
+        self._stats["wait_total"] += waited
+        self._stats["wait_max"] = max(self._stats["wait_max"], waited)
+        self._stats["in_use"] += 1
+
+        try:
+            context = await entry.browser.new_context(**options)
+        except Exception:
+            await self._release(entry)
+            raise
+
+        try:
+            yield context
+        finally:
+            try:
+                await context.close()
+            except Exception as e:
+                print(f"Failed to close browser context: {e}")
+            await self._release(entry)
+
+    async def _acquire(self) -> _PooledBrowser:
+        async with self._cond:
+            while True:
+                if self._playwright is None:
+                    self._playwright = await async_playwright().start()
+
+                candidates = [b for b in self._browsers if self._usable(b) and b.active < self.contexts_per_browser]
+                if candidates:
+                    entry = min(candidates, key=lambda b: b.active)
+                    entry.active += 1
+                    entry.served += 1
+                    self._stats["hits"] += 1
+                    return entry
+
+                if len(self._browsers) < self.size:
+                    # Reserve the slot so concurrent waiters don't over-launch
+                    entry = _PooledBrowser()
+                    entry.active = 1
+                    entry.served = 1
+                    self._browsers.append(entry)
+                    self._stats["misses"] += 1
+                    break
+
+                await self._cond.wait()
+
+        try:
+            entry.browser = await self._playwright.chromium.launch(headless=True)
+            entry.browser.on("disconnected", lambda _: setattr(entry, "crashed", True))
+        except Exception:
+            async with self._cond:
+                self._browsers.remove(entry)
+                self._cond.notify_all()
+            raise
+        return entry
+
+    def _usable(self, entry: _PooledBrowser) -> bool:
+        return (
+            entry.browser is not None
+            and not entry.crashed
+            and entry.browser.is_connected()
+            and entry.served < self.max_contexts
+        )
+
+    async def _release(self, entry: _PooledBrowser) -> None:
+        self._stats["in_use"] -= 1
+        retire = None
+        async with self._cond:
+            entry.active -= 1
+            if entry.active == 0 and not self._usable(entry):
+                self._browsers.remove(entry)
+                retire = entry
+            self._cond.notify_all()
+
+        if retire is not None:
+            if retire.crashed or not retire.browser.is_connected():
+                self._stats["crashed"] += 1
+            else:
+                self._stats["recycled"] += 1
+            try:
+                await retire.browser.close()
+            except Exception as e:
+                print(f"Failed to close recycled browser: {e}")
+
+    async def close(self) -> None:
+        """Close every pooled browser and stop Playwright."""
+        async with self._cond:
+            browsers, self._browsers = self._browsers, []
+        for entry in browsers:
+            if entry.browser is not None:
+                try:
+                    await entry.browser.close()
+                except Exception as e:
+                    print(f"Failed to close browser: {e}")
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    def stats(self) -> dict:
+        """Snapshot of pool hit/miss counters and slot wait times."""
+        stats = dict(self._stats)
+        stats["size"] = self.size
+        stats["browsers"] = len(self._browsers)
+        stats["wait_avg"] = stats["wait_total"] / stats["wait_count"] if stats["wait_count"] else 0.0
+        return stats
+
+browser_pool = BrowserPool()
@@ -0,0 +1,160 @@
+import os
+import time
+import asyncio
+from datetime import datetime
+from nanoid import generate
+
+from app.models import TestCase, CasePlan
+from app.store import store
+from app.services.agent import (
+    run_agent, capture_traced, parse_decision, repair_reply,
+    AGENT_TURN_LIMIT, DECISION_REPAIR_ATTEMPTS, SCREEN_WIDTH, SCREEN_HEIGHT,
+)
+from app.services.gemini import GEMINI_MODEL, get_client, prompt_config
+from app.services.browser_pool import browser_pool
+from app.services.resource_cache import resource_cache
+from app.services.metrics import Tracer
+from app.services import settle
+from app.services.settle import wait_for_settle, NAVIGATION_TIMEOUT_MS
+
+# Case mode configuration
+CASE_LIMIT = int(os.getenv("CASE_LIMIT", "5"))
+CASE_TURN_LIMIT = int(os.getenv("CASE_TURN_LIMIT", str(AGENT_TURN_LIMIT)))
+# Cases of one run executing at once, each in its own browser context; by default all of them
+CASE_CONCURRENCY = int(os.getenv("CASE_CONCURRENCY", str(CASE_LIMIT)))
+
+PLANNER_PROMPT = """You are a QA engineer planning end-to-end tests for a web application.
+
+Given a testing focus and a screenshot of the application's start page, split the focus into independent test cases. Each case starts from the same start page in a fresh browser session, so it must not depend on another case having run.
+
+Respond with JSON only:
+{
+  "cases": [
+    {"title": "Short name of the case", "steps": ["Step a user performs", "..."], "expected": "Observable result that shows the case passed"}
+  ]
+}
+
+Keep steps concrete and few. Prefer several small cases over one long one.""" + f"""
+Plan at most {CASE_LIMIT} cases."""
+
+async def run_cases(
+    test_id: str,
+    url: str,
+    focus: str,
+    events,
+    navigation_timeout_ms: int = NAVIGATION_TIMEOUT_MS,
+    trace: bool = False,
+    **run_options,
+) -> None:
+    """Plan test cases for the focus, then run them concurrently, each in its own context.
+
+    The planning pass looks at the start page once and turns the focus into
+    up to CASE_LIMIT independent cases, stored as pending. Each case then runs
+    the agent with its own turn budget and updates its status, actual result
+    and screenshot when it finishes, so the run takes as long as its slowest
+    case. Playwright traces are not supported in this mode.
+    """
+    tracer = Tracer()
+    usage = {"parse_failures": 0, "wasted_calls": 0}
+    case_tracers: list[Tracer] = []
+
+    try:
+        # Planning pass
+        tracer.turn = 0
+        acquire_started = time.perf_counter()
+        async with browser_pool.context(viewport={"width": SCREEN_WIDTH, "height": SCREEN_HEIGHT}) as context:
+            await settle.install(context)
+            await resource_cache.install(context)
+            page = await context.new_page()
+            tracer.record("browser_launch", time.perf_counter() - acquire_started)
+            with tracer.span("navigation"):
+                await page.goto(url, wait_until="domcontentloaded", timeout=navigation_timeout_ms)
+            with tracer.span("settle"):
+                await wait_for_settle(page, navigation_timeout_ms)
+            frame = await capture_traced(page, tracer)
+
+        with tracer.span("case_planning"):
+            planned = await plan_cases(focus, url, frame, tracer, usage)
+        cases = [
+            TestCase(id=f"case_{generate(size=8)}", title=p.title, steps=p.steps, expected=p.expected, status="pending")
+            for p in planned[:CASE_LIMIT]
+        ]
+        if not cases:
+            print(f"Test {test_id}: no cases planned, running the focus as a single case")
+            cases = [TestCase(id=f"case_{generate(size=8)}", title=focus, steps=[focus], expected="The focus is achieved", status="pending")]
+        for case in cases:
+            store.add_case(test_id, case)
+        store.update(test_id, spans=list(tracer.spans), **usage)
+        for case in cases:
+            await events.emit('testcase', case.model_dump(mode="json"), room=test_id)
+        print(f"Test {test_id}: running {len(cases)} cases")
+
+        # Execution pass; each case reports its own outcome and never raises
+        slots = asyncio.Semaphore(CASE_CONCURRENCY)
+        async def run_case(case: TestCase) -> None:
+            async with slots:
+                case_tracer = Tracer()
+                case_tracers.append(case_tracer)
+                await run_agent(
+                    test_id, url, case_focus(case), events,
+                    navigation_timeout_ms=navigation_timeout_ms,
+                    trace=False,
+                    case=case,
+                    turn_limit=CASE_TURN_LIMIT,
+                    tracer=case_tracer,
+                    usage=usage,
+                    **run_options,
+                )
+        await asyncio.gather(*(run_case(case) for case in cases))
+
+        spans = tracer.spans + [span for case_tracer in case_tracers for span in case_tracer.spans]
+        store.update(test_id, status="complete", completed_at=datetime.now(), spans=spans, **usage)
+        await events.emit('complete', {"test_completed": True}, room=test_id)
+
+    except Exception as e:
+        print(f"Case planning error: {str(e)}")
+        store.update(test_id, status="failed", completed_at=datetime.now(), spans=list(tracer.spans), **usage)
+        await events.emit('error', {"message": str(e)}, room=test_id)
+
+async def plan_cases(focus: str, url: str, frame, tracer: Tracer, usage: dict) -> list:
+    """Ask Gemini to split `focus` into independent test cases for the page in `frame`.
+
+    An invalid plan is repaired like an invalid decision, with up to
+    DECISION_REPAIR_ATTEMPTS text-only re-asks; if it still does not validate,
+    no cases are returned.
+    """
+    prompt = f"Testing focus: {focus}\nStart URL: {url}"
+    config = await prompt_config(PLANNER_PROMPT, response_mime_type="application/json", response_schema=CasePlan)
+    response = await get_client().aio.models.generate_content(
+        model=GEMINI_MODEL,
+        config=config,
+        contents=[{"role": "user", "parts": [
+            {"text": prompt},
+            {"inline_data": {"mime_type": frame.model_mime, "data": frame.model_bytes}},
+        ]}],
+    )
+    response_text = (response.text or "").strip()
+    plan, error = parse_decision(response_text, usage, CasePlan)
+
+    for _ in range(DECISION_REPAIR_ATTEMPTS):
+        if plan is not None:
+            break
+        usage["wasted_calls"] += 1
+        print(f"Invalid case plan ({error}), asking the model to repair it")
+        response_text = await repair_reply(config, prompt, response_text, error, tracer)
+        plan, error = parse_decision(response_text, usage, CasePlan)
+
+    if plan is None:
+        usage["wasted_calls"] += 1
+        print(f"Invalid case plan ({error})")
+        return []
+    return plan.cases
+
+def case_focus(case: TestCase) -> str:
+    """The agent's task for one case."""
+    steps = "\n".join(f"{i}. {step}" for i, step in enumerate(case.steps, start=1))
+    return f"""{case.title}
+Steps:
+{steps}
+Expected result: {case.expected}
+Finish with done, with success true only if the expected result is visible."""
@@ -0,0 +1,49 @@
+import os
+
+from app.store import store, SharedSQLiteStore
+from app.socketio import broadcaster, SOCKET_MESSAGE_QUEUE
+from app.services.scheduler import scheduler
+
+# "local" runs agents in the API process; "distributed" hands them to `python -m app.worker` processes
+RUN_MODE = os.getenv("RUN_MODE", "local")
+
+def create_queue():
+    """Build the job queue for RUN_MODE: the in-process scheduler, or the cross-process job table."""
+    if RUN_MODE == "local":
+        return scheduler
+    if RUN_MODE == "distributed":
+        if not isinstance(store, SharedSQLiteStore):
+            raise ValueError("RUN_MODE=distributed requires STORE_BACKEND=shared")
+        # Without it, events emitted by workers never reach the clients connected to the API
+        if not SOCKET_MESSAGE_QUEUE:
+            raise ValueError("RUN_MODE=distributed requires SOCKET_MESSAGE_QUEUE")
+        from app.services.jobs import JobQueue
+        return JobQueue()
+    raise ValueError(f"Unknown RUN_MODE: {RUN_MODE}")
+
+queue = create_queue()
+
+def submit(test_id: str, kind: str, options: dict, priority: str = "normal", deadline: float | None = None) -> None:
+    """Queue a job of `kind` ("run", "cases" or "batch") with JSON-serializable options.
+
+    Raises QueueFull if the queue is at capacity.
+    """
+    if queue is scheduler:
+        scheduler.submit(test_id, lambda: run_job(kind, test_id, options), priority=priority, deadline=deadline)
+    else:
+        queue.submit(test_id, kind, options, priority=priority, deadline=deadline)
+
+def run_job(kind: str, test_id: str, options: dict):
+    """Coroutine executing a job, wherever it was claimed."""
+    # Imported here because batches dispatch their focuses back through this module
+    from app.services.agent import run_agent
+    from app.services.batch import run_batch
+    from app.services.cases import run_cases
+
+    if kind == "run":
+        return run_agent(test_id, events=broadcaster, **options)
+    if kind == "cases":
+        return run_cases(test_id, events=broadcaster, **options)
+    if kind == "batch":
+        return run_batch(events=broadcaster, **options)
+    raise ValueError(f"Unknown job kind: {kind}")
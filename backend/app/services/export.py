@@ -0,0 +1,113 @@
+import os
+import json
+import zipfile
+from pathlib import Path
+from contextlib import asynccontextmanager
+from typing import Iterator
+
+from app.models import TestRun
+from app.store import store
+from app.services.blobs import blob_store
+
+# Playwright traces are opt-in per run; they are written here, one zip per run
+PLAYWRIGHT_TRACE = os.getenv("PLAYWRIGHT_TRACE", "0") == "1"
+TRACE_DIR = Path(os.getenv("TRACE_DIR", "data/traces"))
+
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+_EXTENSIONS = {
+    "image/png": "png",
+    "image/jpeg": "jpg",
+    "image/webp": "webp",
+}
+
+def trace_path(test_id: str) -> Path:
+    return TRACE_DIR / f"{test_id}.zip"
+
+@asynccontextmanager
+async def record_trace(context, test_id: str, enabled: bool = PLAYWRIGHT_TRACE):
+    """Record a Playwright trace of `context` while the block runs, if `enabled`."""
+    if not enabled:
+        yield
+        return
+    await context.tracing.start(screenshots=True, snapshots=True)
+    try:
+        yield
+    finally:
+        try:
+            TRACE_DIR.mkdir(parents=True, exist_ok=True)
+            await context.tracing.stop(path=trace_path(test_id))
+            store.update(test_id, trace=True)
+        except Exception as e:
+            print(f"Could not save trace for {test_id}: {e}")
+
+class _Chunks:
+    """Write-only file object that collects what the zip writer emits until it is drained."""
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def export_archive(run: TestRun) -> Iterator[bytes]:
+    """Stream `run` as a zip of its screenshots, a JSON manifest and its trace, if any.
+
+    The archive is written to a non-seekable sink and handed out chunk by
+    chunk, so at most one chunk of it is held in memory. Images are stored
+    as-is, since they are already compressed.
+    """
+    sink = _Chunks()
+    for _ in _write_archive(run, sink):
+        data = sink.drain()
+        if data:
+            yield data
+
+def _write_archive(run: TestRun, sink: _Chunks) -> Iterator[None]:
+    # Yields whenever the sink should be drained
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        # Screenshots shared by several actions are written once
+        files: dict[str, tuple[str, Path]] = {}
+        def add_screenshot(digest: str | None, name: str) -> str | None:
+            if not digest:
+                return None
+            if digest not in files:
+                path = blob_store.path(digest)
+                if path is None:
+                    return None
+                extension = _EXTENSIONS.get(blob_store.content_type(path), "bin")
+                files[digest] = (f"{name}.{extension}", path)
+            return files[digest][0]
+
+        manifest = run.model_dump(mode="json")
+        for i, (action, entry) in enumerate(zip(run.actions, manifest["actions"]), start=1):
+            entry["screenshot_file"] = add_screenshot(action.screenshot, f"screenshots/{i:03d}-{action.type}")
+        for i, (case, entry) in enumerate(zip(run.cases, manifest["cases"]), start=1):
+            entry["screenshot_file"] = add_screenshot(case.screenshot, f"cases/{i:03d}")
+        trace = trace_path(run.id) if run.trace else None
+        if trace is not None and not trace.exists():
+            trace = None
+        manifest["trace_file"] = "trace.zip" if trace else None
+
+        archive.writestr("manifest.json", json.dumps(manifest, indent=2))
+        yield
+
+        entries = list(files.values())
+        if trace:
+            entries.append(("trace.zip", trace))
+        for name, path in entries:
+            info = zipfile.ZipInfo.from_file(path, name)
+            with open(path, "rb") as source, archive.open(info, "w", force_zip64=True) as target:
+                while chunk := source.read(EXPORT_CHUNK_SIZE):
+                    target.write(chunk)
+                    yield
+            yield
+    yield
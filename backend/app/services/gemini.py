@@ -1,5 +1,9 @@
 import os
+import time
+import asyncio
 from dotenv import load_dotenv
+from google import genai
+from google.genai import types
 
 load_dotenv()
 
@@ -8,3 +12,55 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 if not GEMINI_API_KEY:
     raise ValueError("GEMINI_API_KEY not found in environment variables")
 
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+GEMINI_CACHE_TTL = int(os.getenv("GEMINI_CACHE_TTL", "3600"))
+
+_client = None
+_cache_lock = asyncio.Lock()
+# System prompt -> (cached content name or None, expiry as monotonic time)
+_prompt_caches: dict[str, tuple[str | None, float]] = {}
+
+def get_client() -> genai.Client:
+    """Process-wide Gemini client, so runs share one connection pool."""
+    global _client
+    if _client is None:
+        _client = genai.Client(api_key=GEMINI_API_KEY)
+    return _client
+
+async def prompt_config(system_prompt: str, **kwargs) -> types.GenerateContentConfig:
+    """Generation config carrying a fixed system prompt.
+
+    The prompt is stored once as cached content and referenced by name. If the
+    model refuses to cache it (e.g. it is below the minimum cacheable size) it
+    is sent as a system instruction instead.
+    """
+    async with _cache_lock:
+        name, expires = _prompt_caches.get(system_prompt, (None, 0.0))
+        # Refresh a minute before expiry so in-flight requests never reference a dead cache
+        if time.monotonic() > expires - 60:
+            name = await _create_cache(system_prompt)
+
+    if name is not None:
+        return types.GenerateContentConfig(cached_content=name, **kwargs)
+    return types.GenerateContentConfig(system_instruction=system_prompt, **kwargs)
+
+async def _create_cache(system_prompt: str) -> str | None:
+    try:
+        cache = await get_client().aio.caches.create(
+            model=GEMINI_MODEL,
+            config=types.CreateCachedContentConfig(
+                system_instruction=system_prompt,
+                ttl=f"{GEMINI_CACHE_TTL}s",
+            ),
+        )
+        name = cache.name
+    except Exception as e:
+        print(f"System prompt caching unavailable, sending it inline: {e}")
+        name = None
+    # Failures are remembered for the same TTL so we don't retry on every turn
+    _prompt_caches[system_prompt] = (name, time.monotonic() + GEMINI_CACHE_TTL)
+    return name
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token)."""
+    return len(text) // 4 + 1
@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from app.store import store, STORE_PATH
+from app.socketio import broadcaster
+from app.services.scheduler import PRIORITIES, QueueFull, SCHEDULER_QUEUE_SIZE, RUN_DEADLINE_SECONDS
+
+# Job queue configuration
+WORKER_STALE_SECONDS = float(os.getenv("WORKER_STALE_SECONDS", "60"))
+
+class JobQueue:
+    """Cross-process run queue kept in a SQLite table next to the shared store.
+
+    API processes submit and cancel jobs; worker processes claim them in
+    priority order, heartbeat the ones they run and poll for cancellations.
+    A job is a `kind` plus JSON options, since a coroutine cannot cross
+    process boundaries.
+    """
+    def __init__(self, path: str = STORE_PATH, queue_size: int = SCHEDULER_QUEUE_SIZE, deadline: float = RUN_DEADLINE_SECONDS):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.queue_size = queue_size
+        self.deadline = deadline
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT UNIQUE NOT NULL,
+                kind TEXT NOT NULL,
+                options TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                deadline REAL NOT NULL,
+                state TEXT NOT NULL,
+                worker TEXT,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                heartbeat REAL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_queued ON jobs (state, priority, seq)")
+        self._lock = threading.RLock()
+
+    def submit(self, test_id: str, kind: str, options: dict, priority: str = "normal", deadline: float | None = None) -> None:
+        """Queue a job. Raises QueueFull if the queue is at capacity."""
+        with self._lock:
+            if self.queue_depth >= self.queue_size:
+                raise QueueFull(f"Run queue is full ({self.queue_size} waiting)")
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs (id, kind, options, priority, deadline, state) VALUES (?, ?, ?, ?, ?, 'queued')",
+                (test_id, kind, json.dumps(options), PRIORITIES[priority], deadline or self.deadline),
+            )
+        store.update(test_id, status="queued", queued_at=datetime.now())
+        self.publish_positions()
+
+    def cancel(self, test_id: str) -> bool:
+        """Cancel a queued job, or ask the worker running it to cancel it. Returns False if it is neither."""
+        with self._lock:
+            queued = self._db.execute(
+                "UPDATE jobs SET state = 'cancelled' WHERE id = ? AND state = 'queued'", (test_id,)
+            ).rowcount
+            if not queued:
+                return bool(self._db.execute(
+                    "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND state = 'running'", (test_id,)
+                ).rowcount)
+        store.update(test_id, status="cancelled", completed_at=datetime.now())
+        broadcaster.emit_status(test_id, status="cancelled")
+        self.publish_positions()
+        return True
+
+    def position(self, test_id: str) -> int | None:
+        """1-based position in the queue, or None if the job is not queued."""
+        with self._lock:
+            row = self._db.execute("SELECT priority, seq FROM jobs WHERE id = ? AND state = 'queued'", (test_id,)).fetchone()
+            if row is None:
+                return None
+            ahead = self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE state = 'queued' AND (priority < ? OR (priority = ? AND seq < ?))",
+                (row[0], row[0], row[1]),
+            ).fetchone()[0]
+        return ahead + 1
+
+    def has_capacity(self, count: int) -> bool:
+        """Whether `count` more jobs fit in the queue."""
+        return self.queue_depth + count <= self.queue_size
+
+    @property
+    def queue_depth(self) -> int:
+        return self._count("queued")
+
+    @property
+    def active(self) -> int:
+        return self._count("running")
+
+    def claim(self, worker_id: str) -> tuple[str, str, dict, float] | None:
+        """Take the next queued job for `worker_id`, as (test_id, kind, options, deadline)."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT id, kind, options, deadline FROM jobs WHERE state = 'queued' ORDER BY priority, seq LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE jobs SET state = 'running', worker = ?, heartbeat = ? WHERE id = ?",
+                        (worker_id, time.time(), row[0]),
+                    )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        self.publish_positions()
+        return row[0], row[1], json.loads(row[2]), row[3]
+
+    def heartbeat(self, worker_id: str) -> list[str]:
+        """Mark the worker's jobs alive and return the ids it has been asked to cancel."""
+        with self._lock:
+            self._db.execute("UPDATE jobs SET heartbeat = ? WHERE worker = ? AND state = 'running'", (time.time(), worker_id))
+            rows = self._db.execute(
+                "SELECT id FROM jobs WHERE worker = ? AND state = 'running' AND cancel_requested = 1", (worker_id,)
+            ).fetchall()
+        return [id for (id,) in rows]
+
+    def finish(self, test_id: str) -> None:
+        with self._lock:
+            self._db.execute("UPDATE jobs SET state = 'done' WHERE id = ?", (test_id,))
+
+    def reap(self) -> None:
+        """Fail the jobs of workers that stopped heartbeating."""
+        cutoff = time.time() - WORKER_STALE_SECONDS
+        with self._lock:
+            rows = self._db.execute("SELECT id FROM jobs WHERE state = 'running' AND heartbeat < ?", (cutoff,)).fetchall()
+            self._db.execute("UPDATE jobs SET state = 'done' WHERE state = 'running' AND heartbeat < ?", (cutoff,))
+        for (test_id,) in rows:
+            print(f"{test_id}: worker stopped responding, marking the run failed")
+            store.update(test_id, status="failed", completed_at=datetime.now())
+            broadcaster.emit_status(test_id, status="failed")
+
+    def publish_positions(self) -> None:
+        # Coalesced per room by the broadcaster, like the in-process scheduler
+        with self._lock:
+            rows = self._db.execute("SELECT id FROM jobs WHERE state = 'queued' ORDER BY priority, seq").fetchall()
+        for position, (test_id,) in enumerate(rows, start=1):
+            broadcaster.emit_status(test_id, queue_position=position)
+
+    def _count(self, state: str) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM jobs WHERE state = ?", (state,)).fetchone()[0]
@@ -0,0 +1,93 @@
+import time
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+
+from app.models import Span
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Histogram:
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+class Metrics:
+    """Process-wide phase histograms and run counters, rendered in Prometheus text format."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._phases: dict[str, Histogram] = {}
+        self._runs: dict[str, int] = {}
+
+    def observe(self, phase: str, seconds: float) -> None:
+        with self._lock:
+            histogram = self._phases.get(phase)
+            if histogram is None:
+                histogram = self._phases[phase] = Histogram()
+            histogram.observe(seconds)
+
+    def count_run(self, status: str) -> None:
+        with self._lock:
+            self._runs[status] = self._runs.get(status, 0) + 1
+
+    def render(self, gauges: dict[str, tuple[str, float]]) -> str:
+        """Prometheus exposition of the histograms, run counters and the given `name -> (help, value)` gauges."""
+        lines = [
+            "# HELP testpilot_phase_seconds Time spent in each phase of an agent run.",
+            "# TYPE testpilot_phase_seconds histogram",
+        ]
+        with self._lock:
+            for phase, histogram in sorted(self._phases.items()):
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(f'testpilot_phase_seconds_bucket{{phase="{phase}",le="{bound}"}} {count}')
+                lines.append(f'testpilot_phase_seconds_bucket{{phase="{phase}",le="+Inf"}} {histogram.count}')
+                lines.append(f'testpilot_phase_seconds_sum{{phase="{phase}"}} {histogram.sum}')
+                lines.append(f'testpilot_phase_seconds_count{{phase="{phase}"}} {histogram.count}')
+
+            lines.append("# HELP testpilot_runs_total Finished runs by final status.")
+            lines.append("# TYPE testpilot_runs_total counter")
+            for status, count in sorted(self._runs.items()):
+                lines.append(f'testpilot_runs_total{{status="{status}"}} {count}')
+
+        for name, (help_text, value) in gauges.items():
+            lines.append(f"# HELP testpilot_{name} {help_text}")
+            lines.append(f"# TYPE testpilot_{name} gauge")
+            lines.append(f"testpilot_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+class Tracer:
+    """Collects the spans of one run and feeds them into the process histograms."""
+    def __init__(self):
+        self.spans: list[Span] = []
+        self.turn: int | None = None
+
+    @contextmanager
+    def span(self, phase: str, turn: int | None = None):
+        started_at = datetime.now()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, time.perf_counter() - start, started_at, turn)
+
+    def record(self, phase: str, seconds: float, started_at: datetime | None = None, turn: int | None = None) -> None:
+        """Record a phase timed elsewhere; `turn` overrides the current turn for work finishing late."""
+        self.spans.append(Span(
+            phase=phase,
+            turn=self.turn if turn is None else turn,
+            started_at=started_at or datetime.now(),
+            duration_ms=round(seconds * 1000, 2),
+        ))
+        metrics.observe(phase, seconds)
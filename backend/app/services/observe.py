@@ -0,0 +1,121 @@
+import os
+
+# "screenshot" sends every frame to the model; "dom" sends an indexed list of interactive elements instead
+OBSERVATION_MODE = os.getenv("OBSERVATION_MODE", "screenshot")
+OBSERVE_MAX_ELEMENTS = int(os.getenv("OBSERVE_MAX_ELEMENTS", "150"))
+# Element actions fail instead of hanging when the indexed element is gone or covered
+ELEMENT_TIMEOUT_MS = int(os.getenv("ELEMENT_TIMEOUT_MS", "5000"))
+
+INDEX_ATTRIBUTE = "data-testpilot-index"
+
+# Indexes visible interactive elements in document order and stamps the index on each, so it resolves to a locator
+SNAPSHOT_SCRIPT = """(limit) => {
+  const SELECTOR = [
+    'a[href]', 'button', 'input:not([type=hidden])', 'select', 'textarea', 'summary',
+    '[role=button]', '[role=link]', '[role=checkbox]', '[role=radio]', '[role=switch]', '[role=tab]',
+    '[role=menuitem]', '[role=option]', '[role=combobox]', '[role=textbox]',
+    '[contenteditable=""]', '[contenteditable=true]', '[onclick]', '[tabindex]:not([tabindex="-1"])',
+  ].join(',');
+  const clean = (text) => (text || '').replace(/\\s+/g, ' ').trim().slice(0, 80);
+
+  document.querySelectorAll('[data-testpilot-index]').forEach((el) => el.removeAttribute('data-testpilot-index'));
+  const elements = [];
+  for (const el of document.querySelectorAll(SELECTOR)) {
+    if (elements.length >= limit) break;
+    const rect = el.getBoundingClientRect();
+    if (rect.width < 1 || rect.height < 1) continue;
+    const style = getComputedStyle(el);
+    if (style.visibility === 'hidden' || style.display === 'none' || Number(style.opacity) === 0) continue;
+    // Far off-screen elements are left for after a scroll
+    if (rect.bottom < -innerHeight || rect.top > 2 * innerHeight) continue;
+
+    const index = elements.length;
+    el.setAttribute('data-testpilot-index', String(index));
+    const type = (el.getAttribute('type') || '').toLowerCase();
+    let value = '';
+    if (['INPUT', 'TEXTAREA', 'SELECT'].includes(el.tagName) && typeof el.value === 'string') {
+      value = type === 'password' ? (el.value ? '********' : '') : clean(el.value);
+    }
+    elements.push({
+      index,
+      tag: el.tagName.toLowerCase(),
+      role: el.getAttribute('role') || '',
+      type,
+      name: clean(el.getAttribute('aria-label') || (el.labels && el.labels[0] && el.labels[0].innerText)
+        || el.getAttribute('placeholder') || el.innerText || el.getAttribute('alt')
+        || el.getAttribute('title') || el.getAttribute('name')),
+      value,
+      href: el.tagName === 'A' ? clean(el.getAttribute('href')) : '',
+      checked: el.checked === true,
+      disabled: el.disabled === true,
+      position: rect.bottom <= 0 ? 'above' : rect.top >= innerHeight ? 'below' : '',
+    });
+  }
+  return {
+    title: clean(document.title),
+    scrollY: Math.round(scrollY),
+    scrollHeight: document.documentElement.scrollHeight,
+    canvas: !!document.querySelector('canvas'),
+    elements,
+  };
+}"""
+
+class Snapshot:
+    """Pruned, indexed list of a page's interactive elements."""
+    def __init__(self, data: dict):
+        self.title = data["title"]
+        self.scroll_y = data["scrollY"]
+        self.scroll_height = data["scrollHeight"]
+        self.canvas = data["canvas"]
+        self.elements: list[dict] = data["elements"]
+
+    def text(self) -> str:
+        """One line per element, e.g. `[3] button "Sign up"`."""
+        lines = [f"Page title: {self.title}", f"Scrolled to {self.scroll_y}px of {self.scroll_height}px", "Interactive elements:"]
+        for el in self.elements:
+            kind = el["role"] or (f"{el['tag']} type={el['type']}" if el["type"] else el["tag"])
+            line = f"[{el['index']}] {kind} \"{el['name']}\""
+            if el["value"]:
+                line += f" value=\"{el['value']}\""
+            if el["href"]:
+                line += f" -> {el['href']}"
+            flags = [flag for flag in ("checked", "disabled") if el[flag]]
+            if el["position"]:
+                flags.append(el["position"])
+            if flags:
+                line += f" ({', '.join(flags)})"
+            lines.append(line)
+        if not self.elements:
+            lines.append("(none)")
+        return "\n".join(lines)
+
+    @property
+    def ambiguous(self) -> str | None:
+        """Why the list alone does not describe the page well enough, or None."""
+        if not self.elements:
+            return "no interactive elements found"
+        if self.canvas:
+            return "the page draws on a canvas"
+        unnamed = sum(1 for el in self.elements if not el["name"])
+        if unnamed * 4 > len(self.elements):
+            return f"{unnamed} elements have no label"
+        seen = set()
+        for el in self.elements:
+            key = (el["tag"], el["role"], el["name"])
+            if el["name"] and key in seen:
+                return f"several elements are labelled \"{el['name']}\""
+            seen.add(key)
+        return None
+
+    def describe(self, index: int) -> str:
+        for el in self.elements:
+            if el["index"] == index:
+                return f"[{index}] {el['name'] or el['tag']}"
+        return f"[{index}]"
+
+async def take_snapshot(page, limit: int = OBSERVE_MAX_ELEMENTS) -> Snapshot:
+    """Index the page's interactive elements; their indexes resolve through `element_locator`."""
+    return Snapshot(await page.evaluate(SNAPSHOT_SCRIPT, limit))
+
+def element_locator(page, index: int):
+    return page.locator(f'[{INDEX_ATTRIBUTE}="{index}"]')
@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from pathlib import Path
+from urllib.parse import urlsplit
+
+# Static subresources are cached on local disk, one directory per origin, and shared across runs
+RESOURCE_CACHE = os.getenv("RESOURCE_CACHE", "1") == "1"
+RESOURCE_CACHE_DIR = Path(os.getenv("RESOURCE_CACHE_DIR", "data/resource-cache"))
+RESOURCE_CACHE_TTL_SECONDS = float(os.getenv("RESOURCE_CACHE_TTL_SECONDS", "3600"))
+RESOURCE_CACHE_MAX_MB = int(os.getenv("RESOURCE_CACHE_MAX_MB", "512"))
+# Comma-separated BLOCKLISTS categories, plus extra domains to block
+RESOURCE_BLOCK = os.getenv("RESOURCE_BLOCK", "analytics,ads")
+RESOURCE_BLOCK_DOMAINS = os.getenv("RESOURCE_BLOCK_DOMAINS", "")
+
+# Documents, fetch and XHR always go to the network so the app's state stays live
+CACHEABLE_TYPES = {"script", "stylesheet", "font", "image"}
+# Larger responses are passed through uncached
+MAX_ENTRY_BYTES = 10 * 1024 * 1024
+# The body is stored decoded, so encoding and framing headers no longer apply
+_DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive"}
+
+# Blocked by domain; a domain also matches its subdomains. Only domains that serve nothing but
+# tracking or ads are listed, so blocking them never removes a feature of the app under test
+BLOCKLISTS = {
+    "analytics": {
+        "google-analytics.com", "analytics.google.com", "googletagmanager.com", "mixpanel.com",
+        "amplitude.com", "hotjar.com", "fullstory.com", "heapanalytics.com", "plausible.io", "clarity.ms",
+        "scorecardresearch.com",
+    },
+    "ads": {
+        "doubleclick.net", "googlesyndication.com", "googleadservices.com", "adservice.google.com",
+        "ads-twitter.com", "ads.linkedin.com", "adnxs.com", "criteo.com", "taboola.com", "outbrain.com",
+        "amazon-adsystem.com",
+    },
+}
+# Blocked by Playwright resource type
+BLOCKED_TYPES = {
+    "media": {"media"},
+}
+
+class ResourceCache:
+    """Disk cache of static subresources served through Playwright request routing.
+
+    Entries are keyed by URL under a directory per origin, expire after
+    `ttl` seconds (or the response's own max-age, if shorter) and are
+    evicted least recently used once the cache exceeds `max_bytes`.
+    Requests matching the block categories are aborted before they leave
+    the browser.
+    """
+    def __init__(
+        self,
+        root: Path = RESOURCE_CACHE_DIR,
+        enabled: bool = RESOURCE_CACHE,
+        ttl: float = RESOURCE_CACHE_TTL_SECONDS,
+        max_bytes: int = RESOURCE_CACHE_MAX_MB * 1024 * 1024,
+        block: str = RESOURCE_BLOCK,
+        block_domains: str = RESOURCE_BLOCK_DOMAINS,
+    ):
+        self.root = Path(root)
+        self.enabled = enabled
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        categories = [name.strip() for name in block.split(",") if name.strip()]
+        unknown = [name for name in categories if name not in BLOCKLISTS and name not in BLOCKED_TYPES]
+        if unknown:
+            raise ValueError(f"Unknown RESOURCE_BLOCK categories: {', '.join(unknown)}")
+        self.blocked_domains = {domain.strip().lower() for domain in block_domains.split(",") if domain.strip()}
+        self.blocked_types = set()
+        for name in categories:
+            self.blocked_domains |= BLOCKLISTS.get(name, set())
+            self.blocked_types |= BLOCKED_TYPES.get(name, set())
+        # Path -> [size, last used]; built from disk on first use
+        self._index: dict[Path, list] | None = None
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stored": 0, "blocked": 0, "evicted": 0}
+
+    async def install(self, context) -> None:
+        """Route `context`'s requests through the cache and blocklists."""
+        if self.enabled or self.blocked_domains or self.blocked_types:
+            await context.route("**/*", self._handle)
+
+    async def _handle(self, route) -> None:
+        request = route.request
+        if self._blocked(request):
+            self._stats["blocked"] += 1
+            await route.abort("blockedbyclient")
+            return
+        if not (self.enabled and request.method == "GET" and request.resource_type in CACHEABLE_TYPES
+                and request.url.startswith(("http://", "https://")) and "authorization" not in request.headers):
+            await route.fallback()
+            return
+
+        entry = await asyncio.to_thread(self._get, request.url)
+        if entry is not None:
+            self._stats["hits"] += 1
+            meta, body = entry
+            await route.fulfill(status=meta["status"], headers=meta["headers"], body=body)
+            return
+
+        self._stats["misses"] += 1
+        try:
+            response = await route.fetch()
+            body = await response.body()
+        except Exception:
+            # Let the browser make the request and surface the failure itself
+            await route.fallback()
+            return
+        headers = {name: value for name, value in response.headers.items() if name.lower() not in _DROPPED_HEADERS}
+        ttl = self._ttl(response.status, headers, body)
+        if ttl:
+            await asyncio.to_thread(self._put, request.url, response.status, headers, body, ttl)
+        await route.fulfill(status=response.status, headers=headers, body=body)
+
+    def _blocked(self, request) -> bool:
+        if request.resource_type in self.blocked_types:
+            return True
+        if not self.blocked_domains:
+            return False
+        host = (urlsplit(request.url).hostname or "").lower()
+        parts = host.split(".")
+        return any(".".join(parts[i:]) in self.blocked_domains for i in range(len(parts) - 1))
+
+    def _ttl(self, status: int, headers: dict, body: bytes) -> float:
+        """Seconds the response may be cached for, or 0 if it must not be."""
+        if status != 200 or len(body) > MAX_ENTRY_BYTES:
+            return 0
+        if any(name.lower() == "set-cookie" for name in headers):
+            return 0
+        cache_control = next((value.lower() for name, value in headers.items() if name.lower() == "cache-control"), "")
+        directives = [d.strip() for d in cache_control.split(",")]
+        if any(d in ("no-store", "no-cache", "private") for d in directives):
+            return 0
+        for d in directives:
+            if d.startswith("max-age="):
+                try:
+                    return min(self.ttl, float(d[len("max-age="):]))
+                except ValueError:
+                    pass
+        return self.ttl
+
+    def _get(self, url: str) -> tuple[dict, bytes] | None:
+        path = self._path(url)
+        try:
+            meta = json.loads(path.with_suffix(".json").read_text())
+            if meta["url"] != url:
+                return None
+            if time.time() > meta["expires_at"]:
+                with self._lock:
+                    self._remove(path)
+                return None
+            body = path.read_bytes()
+        except (OSError, ValueError, KeyError):
+            return None
+        with self._lock:
+            entry = self._load_index().get(path)
+            if entry is not None:
+                entry[1] = time.time()
+        return meta, body
+
+    def _put(self, url: str, status: int, headers: dict, body: bytes, ttl: float) -> None:
+        path = self._path(url)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        meta = {"url": url, "status": status, "headers": headers, "expires_at": time.time() + ttl}
+        # Write the body before its metadata so readers never see a partial entry
+        for target, data in ((path, body), (path.with_suffix(".json"), json.dumps(meta).encode())):
+            tmp = target.with_name(f"{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, target)
+
+        with self._lock:
+            index = self._load_index()
+            previous = index.get(path)
+            if previous is not None:
+                self._bytes -= previous[0]
+            index[path] = [len(body), time.time()]
+            self._bytes += len(body)
+            self._stats["stored"] += 1
+            if self._bytes > self.max_bytes:
+                for victim, _ in sorted(index.items(), key=lambda item: item[1][1]):
+                    if self._bytes <= self.max_bytes:
+                        break
+                    self._remove(victim)
+                    self._stats["evicted"] += 1
+
+    def _load_index(self) -> dict[Path, list]:
+        # Entries written by other processes are picked up on the next start
+        if self._index is None:
+            self._index = {}
+            for path in self.root.glob("*/*.body"):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                self._index[path] = [stat.st_size, stat.st_mtime]
+                self._bytes += stat.st_size
+        return self._index
+
+    def _remove(self, path: Path) -> None:
+        entry = self._load_index().pop(path, None)
+        if entry is not None:
+            self._bytes -= entry[0]
+        for target in (path, path.with_suffix(".json")):
+            try:
+                target.unlink()
+            except OSError:
+                pass
+
+    def _path(self, url: str) -> Path:
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}_{parts.netloc}".replace(":", "_")
+        return self.root / origin / f"{hashlib.sha256(url.encode()).hexdigest()}.body"
+
+    def stats(self) -> dict:
+        """Snapshot of hit/miss/block counters and the cache's size on disk."""
+        stats = dict(self._stats)
+        stats["enabled"] = self.enabled
+        stats["bytes"] = self._bytes
+        stats["entries"] = len(self._index or {})
+        return stats
+
+resource_cache = ResourceCache()
@@ -0,0 +1,161 @@
+import os
+import heapq
+import asyncio
+import itertools
+from datetime import datetime
+
+from app.store import store
+from app.socketio import broadcaster
+from app.services.metrics import metrics
+
+# Scheduler configuration
+SCHEDULER_CONCURRENCY = int(os.getenv("SCHEDULER_CONCURRENCY", "8"))
+SCHEDULER_QUEUE_SIZE = int(os.getenv("SCHEDULER_QUEUE_SIZE", "100"))
+RUN_DEADLINE_SECONDS = float(os.getenv("RUN_DEADLINE_SECONDS", "600"))
+
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+class QueueFull(Exception):
+    """Raised when a run is submitted while the queue is at capacity."""
+
+class _Job:
+    def __init__(self, test_id: str, factory, priority: str, deadline: float, seq: int):
+        self.test_id = test_id
+        self.factory = factory
+        self.priority = PRIORITIES[priority]
+        self.seq = seq
+        self.deadline = deadline
+        self.queued_at = datetime.now()
+        self.cancelled = False
+        self.started = False
+
+class Scheduler:
+    """Runs agent jobs with a concurrency limit, a bounded priority queue and per-run deadlines."""
+    def __init__(
+        self,
+        concurrency: int = SCHEDULER_CONCURRENCY,
+        queue_size: int = SCHEDULER_QUEUE_SIZE,
+        deadline: float = RUN_DEADLINE_SECONDS,
+    ):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.deadline = deadline
+        self._heap: list[tuple[int, int, _Job]] = []  # (priority, submission order, job)
+        self._queued: dict[str, _Job] = {}
+        self._running: dict[str, asyncio.Task] = {}
+        self._seq = itertools.count()
+
+    def submit(self, test_id: str, factory, priority: str = "normal", deadline: float | None = None, queued_at: datetime | None = None) -> None:
+        """Queue `factory()` (a coroutine function) to run as `test_id`.
+
+        `queued_at` keeps the original submission time of a job that waited
+        elsewhere first. Raises QueueFull if the queue is at capacity.
+        """
+        if len(self._queued) >= self.queue_size:
+            raise QueueFull(f"Run queue is full ({self.queue_size} waiting)")
+
+        job = _Job(test_id, factory, priority, deadline or self.deadline, next(self._seq))
+        job.queued_at = queued_at or job.queued_at
+        heapq.heappush(self._heap, (job.priority, job.seq, job))
+        self._queued[test_id] = job
+        store.update(test_id, status="queued", queued_at=job.queued_at)
+        self._dispatch()
+        self._publish_positions()
+
+    def cancel(self, test_id: str) -> bool:
+        """Cancel a queued or running run. Returns False if it is neither."""
+        job = self._queued.pop(test_id, None)
+        if job is not None:
+            # Lazily dropped from the heap when it reaches the front
+            job.cancelled = True
+            store.update(test_id, status="cancelled", completed_at=datetime.now())
+            broadcaster.emit_status(test_id, status="cancelled")
+            self._publish_positions()
+            return True
+
+        task = self._running.get(test_id)
+        if task is not None:
+            task.cancel()
+            return True
+        return False
+
+    def position(self, test_id: str) -> int | None:
+        """1-based position in the queue, or None if the run is not queued."""
+        job = self._queued.get(test_id)
+        if job is None:
+            return None
+        return 1 + sum(1 for other in self._queued.values() if (other.priority, other.seq) < (job.priority, job.seq))
+
+    def has_capacity(self, count: int) -> bool:
+        """Whether `count` more runs fit in the queue."""
+        return len(self._queued) + count <= self.queue_size
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queued)
+
+    @property
+    def active(self) -> int:
+        return len(self._running)
+
+    def _dispatch(self) -> None:
+        while self._heap and len(self._running) < self.concurrency:
+            _, _, job = heapq.heappop(self._heap)
+            if job.cancelled:
+                continue
+            del self._queued[job.test_id]
+            task = asyncio.create_task(self._run(job))
+            # Also runs for a task cancelled before its first step, which never enters _run
+            task.add_done_callback(lambda task, job=job: self._finished(job, task))
+            self._running[job.test_id] = task
+
+    async def _run(self, job: _Job) -> None:
+        job.started = True
+        started_at = datetime.now()
+        wait_seconds = (started_at - job.queued_at).total_seconds()
+        store.update(job.test_id, status="running", started_at=started_at, wait_seconds=wait_seconds)
+        broadcaster.emit_status(job.test_id, status="running", wait_seconds=wait_seconds)
+        try:
+            await asyncio.wait_for(job.factory(), timeout=job.deadline)
+        except asyncio.TimeoutError:
+            message = f"Test exceeded its {job.deadline:.0f}s deadline"
+            print(f"{job.test_id}: {message}")
+            store.update(job.test_id, status="failed", completed_at=datetime.now())
+            await broadcaster.emit('error', {"message": message}, room=job.test_id)
+            broadcaster.emit_status(job.test_id, status="failed")
+        except asyncio.CancelledError:
+            print(f"{job.test_id}: cancelled")
+            store.update(job.test_id, status="cancelled", completed_at=datetime.now())
+            broadcaster.emit_status(job.test_id, status="cancelled")
+        except Exception as e:
+            print(f"{job.test_id}: scheduler job failed: {e}")
+            store.update(job.test_id, status="failed", completed_at=datetime.now())
+
+    def _finished(self, job: _Job, task: asyncio.Task) -> None:
+        if not job.started:
+            print(f"{job.test_id}: cancelled before it started")
+            store.update(job.test_id, status="cancelled", completed_at=datetime.now())
+            broadcaster.emit_status(job.test_id, status="cancelled")
+        run = store.get(job.test_id)
+        if run:
+            metrics.count_run(run.status)
+        if self._running.get(job.test_id) is task:
+            del self._running[job.test_id]
+        self._dispatch()
+        self._publish_positions()
+
+    def _publish_positions(self) -> None:
+        # Coalesced per room, so a burst of queue changes costs one message per client
+        for test_id in self._queued:
+            broadcaster.emit_status(test_id, queue_position=self.position(test_id))
+
+    async def shutdown(self) -> None:
+        """Cancel every queued and running job."""
+        for test_id in list(self._queued):
+            self.cancel(test_id)
+        tasks = list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+scheduler = Scheduler()
@@ -0,0 +1,168 @@
+import io
+import os
+import time
+import asyncio
+import numpy as np
+from PIL import Image
+
+from app.services.blobs import blob_store
+
+# Encoding configuration for the frames sent to Gemini and to the UI
+SCREENSHOT_MODEL_FORMAT = os.getenv("SCREENSHOT_MODEL_FORMAT", "jpeg")
+SCREENSHOT_MODEL_QUALITY = int(os.getenv("SCREENSHOT_MODEL_QUALITY", "70"))
+SCREENSHOT_MODEL_WIDTH = int(os.getenv("SCREENSHOT_MODEL_WIDTH", "1024"))
+SCREENSHOT_UI_FORMAT = os.getenv("SCREENSHOT_UI_FORMAT", "jpeg")
+SCREENSHOT_UI_QUALITY = int(os.getenv("SCREENSHOT_UI_QUALITY", "80"))
+SCREENSHOT_UI_WIDTH = int(os.getenv("SCREENSHOT_UI_WIDTH", "1440"))
+
+# Frame diffing runs on a downsampled grayscale copy of each screenshot, fine enough
+# that a few typed characters still change some of its pixels
+DIFF_WIDTH = 480
+# Gray-level change (0-255) for a downsampled pixel to count as changed
+DIFF_PIXEL_THRESHOLD = int(os.getenv("DIFF_PIXEL_THRESHOLD", "24"))
+# Changes whose bounding box covers less than this fraction of the screen are reported as a region
+DIFF_CROP_RATIO = float(os.getenv("DIFF_CROP_RATIO", "0.3"))
+
+MIME_TYPES = {
+    "png": "image/png",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+}
+
+class FrameDiff:
+    """How much one frame differs from another.
+
+    `score` is the mean absolute gray-level difference (0-1), `changed` the
+    fraction of changed pixels, and `box` the changed area's bounding box as
+    (left, top, right, bottom) fractions of the screen.
+    """
+    def __init__(self, score: float, changed: float, box: tuple[float, float, float, float] | None):
+        self.score = score
+        self.changed = changed
+        self.box = box
+
+    @property
+    def noop(self) -> bool:
+        return self.box is None
+
+    @property
+    def local(self) -> bool:
+        if self.box is None:
+            return False
+        left, top, right, bottom = self.box
+        return (right - left) * (bottom - top) < DIFF_CROP_RATIO
+
+def diff_frames(before: np.ndarray, after: np.ndarray) -> FrameDiff:
+    """Compare two downsampled frames (see `Frame.small`)."""
+    if before.shape != after.shape:
+        return FrameDiff(1.0, 1.0, (0.0, 0.0, 1.0, 1.0))
+    delta = np.abs(after - before)
+    mask = delta > DIFF_PIXEL_THRESHOLD
+    changed = float(mask.mean())
+    box = None
+    if mask.any():
+        rows = np.flatnonzero(mask.any(axis=1))
+        cols = np.flatnonzero(mask.any(axis=0))
+        height, width = mask.shape
+        box = (cols[0] / width, rows[0] / height, (cols[-1] + 1) / width, (rows[-1] + 1) / height)
+    return FrameDiff(round(float(delta.mean()) / 255, 4), changed, box)
+
+class Frame:
+    """One captured screen, encoded once for the model and once for the UI.
+
+    Only the model variant is encoded at capture time, since the next model
+    request waits on it. The UI variant is encoded by `persist`, which can run
+    while that request is in flight.
+
+    When captured against a `reference` frame (the last one the model saw),
+    `diff` describes what changed since, and `region` bounds the change if
+    it is local.
+    """
+    def __init__(self, model_bytes: bytes, model_mime: str, phash: int, image: Image.Image, raw: bytes):
+        self.model_bytes = model_bytes
+        self.model_mime = model_mime
+        self.ui_bytes = None
+        self.ui_mime = MIME_TYPES[SCREENSHOT_UI_FORMAT]
+        self.phash = phash
+        self.small: np.ndarray | None = None
+        self.diff: FrameDiff | None = None
+        self.region: tuple[int, int, int, int] | None = None  # Normalized 0-999 coordinates
+        self.ui_ref = None
+        self.capture_seconds = 0.0
+        self.encode_seconds = 0.0
+        self._image = image
+        self._raw = raw
+        self._lock = asyncio.Lock()
+
+    def encode_ui(self) -> bytes:
+        """Encode the UI variant and drop the decoded screenshot."""
+        if self.ui_bytes is None:
+            self.ui_bytes = _encode(self._image, SCREENSHOT_UI_FORMAT, SCREENSHOT_UI_QUALITY, SCREENSHOT_UI_WIDTH, self._raw)
+            self._image = self._raw = None
+        return self.ui_bytes
+
+async def persist(frame: Frame) -> str:
+    """Encode the UI variant and write it to the blob store once, returning its reference."""
+    async with frame._lock:
+        if frame.ui_ref is None:
+            frame.ui_ref = await asyncio.to_thread(lambda: blob_store.put(frame.encode_ui()))
+    return frame.ui_ref
+
+async def capture(page, reference: Frame | None = None) -> Frame:
+    """Take a screenshot and encode it off the event loop, diffed against `reference` if given."""
+    start = time.perf_counter()
+    raw = await page.screenshot(type="png")
+    captured = time.perf_counter()
+    frame = await asyncio.to_thread(encode_frame, raw, reference)
+    frame.capture_seconds = captured - start
+    frame.encode_seconds = time.perf_counter() - captured
+    return frame
+
+def encode_frame(raw: bytes, reference: Frame | None = None) -> Frame:
+    """Decode a raw PNG screenshot and encode its model variants."""
+    image = Image.open(io.BytesIO(raw))
+    image.load()
+    model_bytes = _encode(image, SCREENSHOT_MODEL_FORMAT, SCREENSHOT_MODEL_QUALITY, SCREENSHOT_MODEL_WIDTH, raw)
+    frame = Frame(model_bytes, MIME_TYPES[SCREENSHOT_MODEL_FORMAT], perceptual_hash(image), image, raw)
+
+    height = max(1, round(image.height * DIFF_WIDTH / image.width))
+    frame.small = np.asarray(image.convert("L").resize((DIFF_WIDTH, height), Image.Resampling.BILINEAR), dtype=np.int16)
+    if reference is None or reference.small is None:
+        return frame
+
+    frame.diff = diff_frames(reference.small, frame.small)
+    if frame.diff.local:
+        left, top, right, bottom = frame.diff.box
+        frame.region = (round(left * 999), round(top * 999), round(right * 999), round(bottom * 999))
+    return frame
+
+def perceptual_hash(image: Image.Image) -> int:
+    """64-bit difference hash; visually similar screens differ in few bits."""
+    pixels = list(image.convert("L").resize((9, 8), Image.Resampling.BILINEAR).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (left > right)
+    return bits
+
+def _encode(image: Image.Image, fmt: str, quality: int, width: int, raw: bytes | None) -> bytes:
+    if fmt not in MIME_TYPES:
+        raise ValueError(f"Unsupported screenshot format: {fmt}")
+    # Reuse the captured bytes when no re-encoding is needed
+    if fmt == "png" and raw is not None and image.width <= width:
+        return raw
+
+    if image.width > width:
+        height = round(image.height * width / image.width)
+        image = image.resize((width, height), Image.Resampling.BILINEAR)
+    if fmt == "jpeg" and image.mode != "RGB":
+        image = image.convert("RGB")
+
+    out = io.BytesIO()
+    if fmt == "png":
+        image.save(out, format="PNG")
+    else:
+        image.save(out, format=fmt.upper(), quality=quality)
+    return out.getvalue()
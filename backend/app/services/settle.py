@@ -0,0 +1,103 @@
+import os
+import time
+import hashlib
+
+# Default ceilings (ms) for waiting on a page to settle; runs may override them
+SETTLE_TIMEOUT_MS = int(os.getenv("SETTLE_TIMEOUT_MS", "5000"))
+NAVIGATION_TIMEOUT_MS = int(os.getenv("NAVIGATION_TIMEOUT_MS", "15000"))
+# The DOM must be free of mutations for this long to count as quiet
+SETTLE_QUIET_MS = int(os.getenv("SETTLE_QUIET_MS", "300"))
+# Requests in flight for longer than this (long polls, streams) no longer hold the page unsettled
+SETTLE_REQUEST_CUTOFF_MS = int(os.getenv("SETTLE_REQUEST_CUTOFF_MS", "1000"))
+SETTLE_POLL_MS = 100
+
+# Installed on every document of a run's context; tracks DOM mutations and in-flight fetch/XHR requests
+SETTLE_SCRIPT = """
+(() => {
+  if (window.__testpilot) return;
+  // In-flight request id -> start time
+  const state = window.__testpilot = { requests: new Map(), nextId: 0, lastMutation: performance.now() };
+  const start = () => {
+    const id = state.nextId++;
+    state.requests.set(id, performance.now());
+    return () => { state.requests.delete(id); };
+  };
+
+  const origFetch = window.fetch;
+  if (origFetch) {
+    window.fetch = function (...args) {
+      const done = start();
+      return origFetch.apply(this, args).finally(done);
+    };
+  }
+
+  const origSend = XMLHttpRequest.prototype.send;
+  XMLHttpRequest.prototype.send = function (...args) {
+    this.addEventListener('loadend', start(), { once: true });
+    return origSend.apply(this, args);
+  };
+
+  const observe = () => {
+    new MutationObserver(() => { state.lastMutation = performance.now(); })
+      .observe(document, { childList: true, subtree: true, attributes: true, characterData: true });
+  };
+  if (document.documentElement) observe();
+  else document.addEventListener('DOMContentLoaded', observe, { once: true });
+})();
+"""
+
+_PROBE = """(cutoffMs) => {
+  const s = window.__testpilot;
+  if (!s) return null;
+  const now = performance.now();
+  let pending = 0;
+  for (const started of s.requests.values()) {
+    if (now - started < cutoffMs) pending++;
+  }
+  return { ready: document.readyState, pending, quietFor: now - s.lastMutation };
+}"""
+
+async def install(context) -> None:
+    """Install the settle monitors on every page of `context`."""
+    await context.add_init_script(SETTLE_SCRIPT)
+
+async def wait_for_settle(page, timeout_ms: int = SETTLE_TIMEOUT_MS, quiet_ms: int = SETTLE_QUIET_MS) -> int:
+    """Wait until the page is stable and return the milliseconds spent waiting.
+
+    A page is stable once its document has loaded, no fetch/XHR request started
+    in the last SETTLE_REQUEST_CUTOFF_MS is in flight, the DOM has been free of
+    mutations for `quiet_ms`, and two consecutive frames are identical. Gives
+    up after `timeout_ms`.
+    """
+    started = time.monotonic()
+    deadline = started + timeout_ms / 1000
+    last_frame = None
+
+    while time.monotonic() < deadline:
+        try:
+            state = await page.evaluate(_PROBE, SETTLE_REQUEST_CUTOFF_MS)
+            # Documents without the monitors (e.g. about:blank) are judged on visual stability alone
+            quiet = state is None or (state["ready"] == "complete" and state["pending"] == 0 and state["quietFor"] >= quiet_ms)
+        except Exception:
+            # The execution context was replaced by a navigation; probe the new document
+            quiet = False
+
+        if quiet:
+            frame = await _frame_digest(page)
+            if frame is not None and frame == last_frame:
+                break
+            last_frame = frame
+        else:
+            last_frame = None
+
+        await page.wait_for_timeout(SETTLE_POLL_MS)
+
+    return int((time.monotonic() - started) * 1000)
+
+async def _frame_digest(page) -> str | None:
+    # A small low-quality frame is enough to tell whether anything is still moving
+    try:
+        data = await page.screenshot(type="jpeg", quality=20, scale="css", animations="allow")
+    except Exception:
+        return None
+    return hashlib.sha1(data).hexdigest()
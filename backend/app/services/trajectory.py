@@ -0,0 +1,84 @@
+import os
+import json
+import hashlib
+import tempfile
+from pathlib import Path
+
+# Recorded trajectories, one file per (url, focus)
+TRAJECTORY_DIR = Path(os.getenv("TRAJECTORY_DIR", "data/trajectories"))
+# Max perceptual hash distance (bits out of 64) for a screen to still match the recording
+REPLAY_HASH_THRESHOLD = int(os.getenv("REPLAY_HASH_THRESHOLD", "10"))
+
+def trajectory_path(url: str, focus: str) -> Path:
+    key = hashlib.sha256(f"{url}\n{focus}".encode("utf-8")).hexdigest()[:32]
+    return TRAJECTORY_DIR / f"{key}.json"
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+class TrajectoryRecorder:
+    """Records each decision with the perceptual hash of the screen that led to it."""
+    def __init__(self, url: str, focus: str):
+        self.url = url
+        self.focus = focus
+        self.steps: list[dict] = []
+
+    def record(self, decision: dict, phash: int) -> None:
+        self.steps.append({
+            "action": decision.get("action", ""),
+            "args": decision.get("args", {}),
+            "observation": decision.get("observation", ""),
+            "reasoning": decision.get("reasoning", ""),
+            "plan": decision.get("plan", []),
+            "phash": f"{phash:016x}",
+        })
+
+    def save(self) -> None:
+        path = trajectory_path(self.url, self.focus)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Concurrent runs of the same url and focus each write their own temp file; the last rename wins
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f"{path.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"url": self.url, "focus": self.focus, "steps": self.steps}, f)
+            os.replace(tmp, path)
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+class TrajectoryReplayer:
+    """Serves recorded decisions for as long as the screen matches the recording."""
+    def __init__(self, steps: list[dict], threshold: int = REPLAY_HASH_THRESHOLD):
+        self.steps = steps
+        self.threshold = threshold
+        self.position = 0
+        self.drifted = False
+
+    @classmethod
+    def load(cls, url: str, focus: str) -> "TrajectoryReplayer | None":
+        path = trajectory_path(url, focus)
+        if not path.exists():
+            return None
+        try:
+            return cls(json.loads(path.read_text())["steps"])
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Could not load trajectory {path}: {e}")
+            return None
+
+    def next(self, phash: int) -> dict | None:
+        """Return the next recorded decision, or None once the screen has drifted."""
+        if self.drifted or self.position >= len(self.steps):
+            return None
+        step = self.steps[self.position]
+        distance = hamming(phash, int(step["phash"], 16))
+        if distance > self.threshold:
+            print(f"Replay drifted at step {self.position + 1} (distance {distance}), falling back to the model")
+            self.drifted = True
+            return None
+        self.position += 1
+        decision = {key: step[key] for key in ("action", "args", "observation", "reasoning")}
+        decision["plan"] = step.get("plan", [])
+        return decision
@@ -1,5 +1,234 @@
+import os
+import time
+import base64
+import asyncio
+import sqlite3
+import threading
+from collections import deque
+from pathlib import Path
 import socketio
+from socketio.packet import Packet
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+# Streaming configuration
+SOCKET_CLIENT_BUFFER = int(os.getenv("SOCKET_CLIENT_BUFFER", "64"))
+SOCKET_FLUSH_INTERVAL = float(os.getenv("SOCKET_FLUSH_INTERVAL", "0.05"))
+SOCKET_INLINE_SCREENSHOTS = os.getenv("SOCKET_INLINE_SCREENSHOTS", "0") == "1"
+# Message queue shared by API and worker processes, e.g. redis://localhost:6379/0 or sqlite:///data/events.db
+SOCKET_MESSAGE_QUEUE = os.getenv("SOCKET_MESSAGE_QUEUE", "")
+SOCKET_QUEUE_RETENTION = float(os.getenv("SOCKET_QUEUE_RETENTION", "60"))
+
+class _Relay:
+    """Hands events published by any process to this process's broadcaster.
+
+    Mixed into a pub/sub client manager in place of its direct room delivery,
+    so events from worker processes still go through per-client buffering.
+    """
+    broadcaster = None
+
+    async def _handle_emit(self, message):
+        data = message['data']
+        if message.get('binary'):
+            attachments = [base64.b64decode(a) for a in data[1:]]
+            data = Packet.reconstruct_binary(data[0], attachments)
+        if isinstance(data, list):
+            data = data[0]
+        if self.broadcaster is not None:
+            self.broadcaster._deliver(message['event'], data, message['room'])
+
+class RedisQueueManager(_Relay, socketio.AsyncRedisManager):
+    pass
+
+class SQLiteQueueManager(_Relay, AsyncPubSubManager):
+    """Pub/sub through a table in a local SQLite file, a stand-in for Redis on a single host."""
+    name = 'sqlitequeue'
+
+    def __init__(self, path: str, channel: str = 'socketio', write_only: bool = False, poll_interval: float = SOCKET_FLUSH_INTERVAL):
+        super().__init__(channel=channel, write_only=write_only)
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.poll_interval = poll_interval
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS socket_events (id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, created REAL NOT NULL, data TEXT NOT NULL)")
+        self._lock = threading.Lock()
+        self._published = 0
+
+    async def _publish(self, data):
+        await asyncio.to_thread(self._insert, self.json.dumps(data))
+
+    async def _listen(self):
+        last = await asyncio.to_thread(self._last_id)
+        while True:
+            for id, data in await asyncio.to_thread(self._fetch, last):
+                last = id
+                yield data
+            await asyncio.sleep(self.poll_interval)
+
+    def _insert(self, payload: str) -> None:
+        with self._lock:
+            now = time.time()
+            self._db.execute("INSERT INTO socket_events (channel, created, data) VALUES (?, ?, ?)", (self.channel, now, payload))
+            self._published += 1
+            # Listeners only read new rows, so old ones are pruned now and then
+            if self._published % 100 == 0:
+                self._db.execute("DELETE FROM socket_events WHERE created < ?", (now - SOCKET_QUEUE_RETENTION,))
+
+    def _last_id(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(MAX(id), 0) FROM socket_events").fetchone()[0]
+
+    def _fetch(self, after: int) -> list[tuple[int, str]]:
+        with self._lock:
+            return self._db.execute(
+                "SELECT id, data FROM socket_events WHERE id > ? AND channel = ? ORDER BY id", (after, self.channel)
+            ).fetchall()
+
+def create_manager():
+    """Build the cross-process client manager selected by SOCKET_MESSAGE_QUEUE, or None for a single process."""
+    if not SOCKET_MESSAGE_QUEUE:
+        return None
+    if SOCKET_MESSAGE_QUEUE.startswith("sqlite:///"):
+        return SQLiteQueueManager(SOCKET_MESSAGE_QUEUE[len("sqlite:///"):])
+    return RedisQueueManager(SOCKET_MESSAGE_QUEUE)
 
 # Create Socket.io server
-sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*')
+manager = create_manager()
+sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*', client_manager=manager)
+
+class _Client:
+    """Outgoing buffer for one connected socket."""
+    def __init__(self, sid: str):
+        self.sid = sid
+        self.rooms: set[str] = set()
+        self.events: deque = deque()  # (room, event, data)
+        self.status: dict[str, dict] = {}
+        self.overflowed: set[str] = set()
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+class Broadcaster:
+    """Per-room event fan-out with coalescing and bounded per-client buffers.
+
+    Every client gets its own sender task. Status deltas for a room are merged
+    while they wait to be sent, and sends are throttled to one flush per
+    `flush_interval`. When a slow client's buffer fills up its queued events
+    for that room are dropped and it is sent a single `resync` event instead,
+    telling it to re-read the run over HTTP.
+
+    With a message queue `manager`, events are published to every process
+    and each one delivers them to its own clients.
+    """
+    def __init__(self, server: socketio.AsyncServer, buffer_size: int = SOCKET_CLIENT_BUFFER, flush_interval: float = SOCKET_FLUSH_INTERVAL, manager=None):
+        self.server = server
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.manager = manager
+        self._clients: dict[str, _Client] = {}
+        self._rooms: dict[str, set[str]] = {}
+        self._publishing: set[asyncio.Task] = set()
+        if manager is not None:
+            manager.broadcaster = self
+
+    async def join(self, sid: str, room: str) -> None:
+        client = self._clients.get(sid)
+        if client is None:
+            client = self._clients[sid] = _Client(sid)
+            client.task = asyncio.create_task(self._sender(client))
+        client.rooms.add(room)
+        self._rooms.setdefault(room, set()).add(sid)
+        await self.server.enter_room(sid, room)
+
+    def leave(self, sid: str) -> None:
+        client = self._clients.pop(sid, None)
+        if client is None:
+            return
+        for room in client.rooms:
+            members = self._rooms.get(room)
+            if members is not None:
+                members.discard(sid)
+                if not members:
+                    del self._rooms[room]
+        if client.task is not None:
+            client.task.cancel()
+
+    async def emit(self, event: str, data: dict, room: str) -> None:
+        """Queue an event for every client in `room`."""
+        if self.manager is not None:
+            await self.manager.emit(event, data, room=room)
+        else:
+            self._deliver(event, data, room)
+
+    def emit_status(self, room: str, **delta) -> None:
+        """Queue a status delta; deltas not yet sent are merged into one."""
+        if self.manager is not None:
+            task = asyncio.create_task(self.manager.emit('status', delta, room=room))
+            self._publishing.add(task)
+            task.add_done_callback(self._publishing.discard)
+        else:
+            self._deliver('status', delta, room)
+
+    async def emit_action(self, room: str, action, image: bytes | None = None) -> None:
+        """Queue an action; its screenshot travels as a blob reference, or as a binary attachment if enabled."""
+        data = action.model_dump(mode="json")
+        if SOCKET_INLINE_SCREENSHOTS and image is not None:
+            data["image"] = image
+        await self.emit('action', data, room)
+
+    def _deliver(self, event: str, data: dict, room: str) -> None:
+        # Buffer an event for this process's clients in `room`
+        for sid in self._rooms.get(room, ()):
+            client = self._clients[sid]
+            if event == 'status':
+                client.status.setdefault(room, {}).update(data)
+            else:
+                if len(client.events) >= self.buffer_size:
+                    self._overflow(client, room)
+                if len(client.events) < self.buffer_size:
+                    client.events.append((room, event, data))
+            client.wakeup.set()
+
+    def _overflow(self, client: _Client, room: str) -> None:
+        # Actions can be re-read from the run, so they are the ones dropped
+        client.events = deque(e for e in client.events if e[0] != room or e[1] != 'action')
+        client.overflowed.add(room)
+        print(f"Socket {client.sid} fell behind on {room}, asking it to resync")
+
+    async def _sender(self, client: _Client) -> None:
+        try:
+            while True:
+                await client.wakeup.wait()
+                client.wakeup.clear()
+
+                for room in list(client.overflowed):
+                    client.overflowed.discard(room)
+                    await self.server.emit('resync', {"test_id": room}, to=client.sid, ignore_queue=True)
+
+                status, client.status = client.status, {}
+                for room, delta in status.items():
+                    await self.server.emit('status', {"test_id": room, **delta}, to=client.sid, ignore_queue=True)
+
+                while client.events:
+                    # Leave events in our bounded buffer while the transport is still draining
+                    if self._backlog(client.sid) >= self.buffer_size:
+                        client.wakeup.set()
+                        break
+                    _, event, data = client.events.popleft()
+                    await self.server.emit(event, data, to=client.sid, ignore_queue=True)
+
+                # Throttle: let further events accumulate before the next flush
+                await asyncio.sleep(self.flush_interval)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"Socket sender for {client.sid} stopped: {e}")
+            self.leave(client.sid)
+
+    def _backlog(self, sid: str) -> int:
+        # Packets accepted by Engine.IO but not yet delivered to this client
+        try:
+            eio_sid = self.server.manager.eio_sid_from_sid(sid, '/')
+            return self.server.eio.sockets[eio_sid].queue.qsize()
+        except (KeyError, AttributeError):
+            return 0
 
+broadcaster = Broadcaster(sio, manager=manager)
@@ -1,28 +1,350 @@
-from app.models import TestRun
+import os
+import time
+import atexit
+import sqlite3
+import secrets
+import threading
+from collections import OrderedDict
+from pathlib import Path
 
-class Store:
+from app.models import TestRun, Action, TestCase, TestBatch
+
+# Store configuration
+STORE_BACKEND = os.getenv("STORE_BACKEND", "memory")
+STORE_PATH = os.getenv("STORE_PATH", "data/store.db")
+STORE_CACHE_SIZE = int(os.getenv("STORE_CACHE_SIZE", "128"))
+STORE_FLUSH_SIZE = int(os.getenv("STORE_FLUSH_SIZE", "16"))
+STORE_FLUSH_INTERVAL = float(os.getenv("STORE_FLUSH_INTERVAL", "2.0"))
+
+class MemoryStore:
     def __init__(self):
         self._data: dict[str, TestRun] = {}
-    
+        self._batches: dict[str, TestBatch] = {}
+        self._versions: dict[str, int] = {}
+        # Distinguishes versions handed out by different processes/restarts
+        self.epoch = secrets.token_hex(4)
+
     def get(self, id: str) -> TestRun | None:
         return self._data.get(id)
-    
+
     def set(self, id: str, run: TestRun) -> None:
         self._data[id] = run
-    
+        self._bump(id)
+
     def update(self, id: str, **kwargs) -> None:
         if id in self._data:
             run = self._data[id]
             for key, value in kwargs.items():
                 setattr(run, key, value)
-    
+            self._bump(id)
+
     def add_action(self, id: str, action) -> None:
         if id in self._data:
             self._data[id].actions.append(action)
-    
+            self._bump(id)
+
     def add_case(self, id: str, case) -> None:
         if id in self._data:
             self._data[id].cases.append(case)
+            self._bump(id)
+
+    def update_case(self, id: str, case_id: str, **kwargs) -> None:
+        if id in self._data:
+            for case in self._data[id].cases:
+                if case.id == case_id:
+                    for key, value in kwargs.items():
+                        setattr(case, key, value)
+                    self._bump(id)
+                    return
+
+    def version(self, id: str) -> int:
+        """Counter bumped on every change to the run."""
+        return self._versions.get(id, 0)
+
+    def _bump(self, id: str) -> None:
+        self._versions[id] = self._versions.get(id, 0) + 1
+
+    def get_batch(self, id: str) -> TestBatch | None:
+        return self._batches.get(id)
+
+    def set_batch(self, id: str, batch: TestBatch) -> None:
+        self._batches[id] = batch
+
+    def update_batch(self, id: str, **kwargs) -> None:
+        if id in self._batches:
+            batch = self._batches[id]
+            for key, value in kwargs.items():
+                setattr(batch, key, value)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+class SQLiteStore:
+    """Persists runs to SQLite and keeps a bounded LRU of hot runs in memory.
+
+    Running runs stay cached until they finish; all others are evicted
+    least-recently-used first and reloaded lazily on the next `get`. Action
+    appends are buffered and written in batches.
+    """
+    def __init__(
+        self,
+        path: str = STORE_PATH,
+        cache_size: int = STORE_CACHE_SIZE,
+        flush_size: int = STORE_FLUSH_SIZE,
+        flush_interval: float = STORE_FLUSH_INTERVAL,
+    ):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (id TEXT PRIMARY KEY, data TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS actions (run_id TEXT NOT NULL, idx INTEGER NOT NULL, data TEXT NOT NULL, PRIMARY KEY (run_id, idx));
+            CREATE TABLE IF NOT EXISTS cases (run_id TEXT NOT NULL, idx INTEGER NOT NULL, data TEXT NOT NULL, PRIMARY KEY (run_id, idx));
+            CREATE TABLE IF NOT EXISTS batches (id TEXT PRIMARY KEY, data TEXT NOT NULL);
+        """)
+        self._db.commit()
+        self._lock = threading.RLock()
+        self._cache: OrderedDict[str, TestRun] = OrderedDict()
+        self._cache_size = cache_size
+        self._flush_size = flush_size
+        self._flush_interval = flush_interval
+        self._pending: list[tuple[str, int, str]] = []
+        self._pending_since = 0.0
+        self._versions: dict[str, int] = {}
+        # Versions are drawn from one counter, so a run evicted and changed again never reuses one
+        self._clock = 0
+        # Distinguishes versions handed out by different processes/restarts
+        self.epoch = secrets.token_hex(4)
+        atexit.register(self.close)
+
+    def get(self, id: str) -> TestRun | None:
+        with self._lock:
+            run = self._cache.get(id)
+            if run is not None:
+                self._cache.move_to_end(id)
+                return run
+            run = self._load(id)
+            if run is not None:
+                self._cache_put(id, run)
+            return run
+
+    def set(self, id: str, run: TestRun) -> None:
+        with self._lock:
+            self._flush()
+            self._db.execute("DELETE FROM actions WHERE run_id = ?", (id,))
+            self._db.execute("DELETE FROM cases WHERE run_id = ?", (id,))
+            self._write_run(id, run)
+            self._db.executemany(
+                "INSERT INTO actions (run_id, idx, data) VALUES (?, ?, ?)",
+                [(id, i, a.model_dump_json()) for i, a in enumerate(run.actions)],
+            )
+            self._db.executemany(
+                "INSERT INTO cases (run_id, idx, data) VALUES (?, ?, ?)",
+                [(id, i, c.model_dump_json()) for i, c in enumerate(run.cases)],
+            )
+            self._db.commit()
+            self._cache_put(id, run)
+            self._bump(id)
+
+    def update(self, id: str, **kwargs) -> None:
+        with self._lock:
+            run = self.get(id)
+            if run is None:
+                return
+            for key, value in kwargs.items():
+                setattr(run, key, value)
+            if "actions" in kwargs or "cases" in kwargs:
+                self.set(id, run)
+                return
+            self._flush()
+            self._write_run(id, run)
+            self._db.commit()
+            self._bump(id)
+            # A finished run may now be evicted
+            self._evict()
+
+    def add_action(self, id: str, action) -> None:
+        with self._lock:
+            run = self.get(id)
+            if run is None:
+                return
+            run.actions.append(action)
+            if not self._pending:
+                self._pending_since = time.monotonic()
+            self._pending.append((id, len(run.actions) - 1, action.model_dump_json()))
+            if len(self._pending) >= self._flush_size or time.monotonic() - self._pending_since >= self._flush_interval:
+                self._flush()
+                self._db.commit()
+            # Bumped after the flush, so a version read from another process never precedes its action rows
+            self._bump(id)
+
+    def add_case(self, id: str, case) -> None:
+        with self._lock:
+            run = self.get(id)
+            if run is None:
+                return
+            run.cases.append(case)
+            self._db.execute(
+                "INSERT OR REPLACE INTO cases (run_id, idx, data) VALUES (?, ?, ?)",
+                (id, len(run.cases) - 1, case.model_dump_json()),
+            )
+            self._db.commit()
+            self._bump(id)
+
+    def update_case(self, id: str, case_id: str, **kwargs) -> None:
+        with self._lock:
+            run = self.get(id)
+            if run is None:
+                return
+            for idx, case in enumerate(run.cases):
+                if case.id == case_id:
+                    for key, value in kwargs.items():
+                        setattr(case, key, value)
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO cases (run_id, idx, data) VALUES (?, ?, ?)",
+                        (id, idx, case.model_dump_json()),
+                    )
+                    self._db.commit()
+                    self._bump(id)
+                    return
+
+    def version(self, id: str) -> int:
+        """Counter bumped on every change to the run."""
+        with self._lock:
+            return self._versions.get(id, 0)
+
+    def _bump(self, id: str) -> None:
+        self._clock += 1
+        self._versions[id] = self._clock
+
+    def get_batch(self, id: str) -> TestBatch | None:
+        with self._lock:
+            row = self._db.execute("SELECT data FROM batches WHERE id = ?", (id,)).fetchone()
+        return TestBatch.model_validate_json(row[0]) if row else None
+
+    def set_batch(self, id: str, batch: TestBatch) -> None:
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO batches (id, data) VALUES (?, ?)", (id, batch.model_dump_json()))
+            self._db.commit()
+
+    def update_batch(self, id: str, **kwargs) -> None:
+        with self._lock:
+            batch = self.get_batch(id)
+            if batch is None:
+                return
+            for key, value in kwargs.items():
+                setattr(batch, key, value)
+            self.set_batch(id, batch)
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush()
+            self._db.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+
+    def _write_run(self, id: str, run: TestRun) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO runs (id, data) VALUES (?, ?)",
+            (id, run.model_dump_json(exclude={"actions", "cases"})),
+        )
+
+    def _flush(self) -> None:
+        if self._pending:
+            self._db.executemany("INSERT OR REPLACE INTO actions (run_id, idx, data) VALUES (?, ?, ?)", self._pending)
+            self._pending = []
+
+    def _load(self, id: str) -> TestRun | None:
+        self._flush()
+        row = self._db.execute("SELECT data FROM runs WHERE id = ?", (id,)).fetchone()
+        if row is None:
+            return None
+        run = TestRun.model_validate_json(row[0])
+        run.actions = [
+            Action.model_validate_json(data)
+            for (data,) in self._db.execute("SELECT data FROM actions WHERE run_id = ? ORDER BY idx", (id,))
+        ]
+        run.cases = [
+            TestCase.model_validate_json(data)
+            for (data,) in self._db.execute("SELECT data FROM cases WHERE run_id = ? ORDER BY idx", (id,))
+        ]
+        return run
+
+    def _cache_put(self, id: str, run: TestRun) -> None:
+        self._cache[id] = run
+        self._cache.move_to_end(id)
+        self._evict()
+
+    def _evict(self) -> None:
+        # Evict least-recently-used runs that are not running; they are reloaded on the next get
+        if len(self._cache) <= self._cache_size:
+            return
+        for id in list(self._cache):
+            if len(self._cache) <= self._cache_size:
+                break
+            if self._cache[id].status != "running":
+                del self._cache[id]
+                # Version 0 is never handed out, so the next read misses any ETag; a later change draws a fresh version
+                self._versions.pop(id, None)
+
+class SharedSQLiteStore(SQLiteStore):
+    """SQLiteStore for several processes sharing one database file.
+
+    Only runs this process is executing are served from the cache; every
+    other read goes to the database. Action appends are written immediately,
+    and versions and the epoch live in the database so ETags agree across
+    processes.
+    """
+    def __init__(self, path: str = STORE_PATH, cache_size: int = STORE_CACHE_SIZE):
+        super().__init__(path, cache_size, flush_size=1, flush_interval=0.0)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS versions (run_id TEXT PRIMARY KEY, version INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        """)
+        self._db.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', ?)", (self.epoch,))
+        self._db.commit()
+        self.epoch = self._db.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()[0]
+        self._owned: set[str] = set()
+
+    def get(self, id: str) -> TestRun | None:
+        with self._lock:
+            if id in self._owned:
+                return super().get(id)
+            return self._load(id)
+
+    def update(self, id: str, **kwargs) -> None:
+        with self._lock:
+            # The process that starts a run owns it, and may cache it, until it finishes
+            status = kwargs.get("status")
+            if status == "running":
+                self._owned.add(id)
+            super().update(id, **kwargs)
+            if status is not None and status != "running":
+                self._owned.discard(id)
+
+    def version(self, id: str) -> int:
+        with self._lock:
+            row = self._db.execute("SELECT version FROM versions WHERE run_id = ?", (id,)).fetchone()
+        return row[0] if row else 0
+
+    def _bump(self, id: str) -> None:
+        self._db.execute(
+            "INSERT INTO versions (run_id, version) VALUES (?, 1) ON CONFLICT(run_id) DO UPDATE SET version = version + 1",
+            (id,),
+        )
+        self._db.commit()
 
-store = Store()
+def create_store():
+    """Build the store backend selected by STORE_BACKEND."""
+    if STORE_BACKEND == "sqlite":
+        return SQLiteStore()
+    if STORE_BACKEND == "shared":
+        return SharedSQLiteStore()
+    if STORE_BACKEND == "memory":
+        return MemoryStore()
+    raise ValueError(f"Unknown STORE_BACKEND: {STORE_BACKEND}")
 
+store = create_store()
@@ -0,0 +1,98 @@
+"""Agent worker for RUN_MODE=distributed.
+
+Claims runs from the shared job queue and executes them on this process's
+scheduler and browser pool. API processes and workers share the store and
+the Socket.IO message queue:
+
+    export RUN_MODE=distributed STORE_BACKEND=shared SOCKET_MESSAGE_QUEUE=redis://localhost:6379/0
+    uvicorn app.main:socket_app --workers 2
+    python -m app.worker --processes 4
+"""
+import os
+import asyncio
+import argparse
+import multiprocessing
+from nanoid import generate
+
+from app.store import store
+from app.services import dispatch
+from app.services.scheduler import scheduler
+from app.services.browser_pool import browser_pool
+
+# Worker configuration
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "1"))
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "0.5"))
+
+class Worker:
+    """Claims jobs while this process's scheduler has free slots."""
+    def __init__(self, queue, poll_interval: float = WORKER_POLL_INTERVAL):
+        self.id = f"worker_{generate(size=10)}"
+        self.queue = queue
+        self.poll_interval = poll_interval
+        self._cancelled: set[str] = set()
+
+    async def run(self) -> None:
+        print(f"{self.id}: running up to {scheduler.concurrency} jobs")
+        while True:
+            for test_id in self.queue.heartbeat(self.id):
+                if test_id not in self._cancelled:
+                    self._cancelled.add(test_id)
+                    scheduler.cancel(test_id)
+            self.queue.reap()
+
+            # Only claim what can start now, so queue order stays global across workers
+            while scheduler.active + scheduler.queue_depth < scheduler.concurrency:
+                job = self.queue.claim(self.id)
+                if job is None:
+                    break
+                test_id, kind, options, deadline = job
+                run = store.get(test_id)
+                scheduler.submit(
+                    test_id,
+                    lambda test_id=test_id, kind=kind, options=options: self._execute(test_id, kind, options),
+                    deadline=deadline,
+                    queued_at=run.queued_at if run else None,
+                )
+            await asyncio.sleep(self.poll_interval)
+
+    async def _execute(self, test_id: str, kind: str, options: dict) -> None:
+        try:
+            await dispatch.run_job(kind, test_id, options)
+        finally:
+            self.queue.finish(test_id)
+            self._cancelled.discard(test_id)
+
+async def main() -> None:
+    if dispatch.RUN_MODE != "distributed":
+        raise SystemExit("Workers need RUN_MODE=distributed")
+    worker = Worker(dispatch.queue)
+    try:
+        await worker.run()
+    finally:
+        await scheduler.shutdown()
+        await browser_pool.close()
+
+def serve() -> None:
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=WORKER_PROCESSES, help="Worker processes to start")
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        serve()
+    else:
+        context = multiprocessing.get_context("spawn")
+        processes = [context.Process(target=serve) for _ in range(args.processes)]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.join()
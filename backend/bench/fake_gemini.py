@@ -0,0 +1,92 @@
+import re
+import json
+import random
+import asyncio
+
+# Scripted decisions per fixture. Coordinates are normalized 0-999 against the 1440x900 viewport.
+SCRIPTS = {
+    "form": [
+        {"action": "type_text_at", "args": {"x": 278, "y": 133, "text": "Ada Lovelace", "press_enter": False, "clear_before_typing": True}},
+        {"action": "type_text_at", "args": {"x": 278, "y": 244, "text": "ada@example.com", "press_enter": False, "clear_before_typing": True}},
+        {"action": "click_at", "args": {"x": 278, "y": 356}},
+        {"action": "done", "args": {"success": True, "message": "Signup form submitted"}},
+    ],
+    "list": [
+        {"action": "scroll_document", "args": {"direction": "down"}},
+        {"action": "scroll_document", "args": {"direction": "down"}},
+        {"action": "click_at", "args": {"x": 208, "y": 333}},
+        {"action": "done", "args": {"success": True, "message": "Product selected"}},
+    ],
+    "spa": [
+        {"action": "click_at", "args": {"x": 208, "y": 133}},
+        {"action": "wait_5_seconds", "args": {}},
+        {"action": "done", "args": {"success": True, "message": "Dashboard loaded"}},
+    ],
+}
+
+# Runs are told apart by a "[fixture#n]" tag in their focus
+_TAG_RE = re.compile(r"\[(\w+)#(\d+)\]")
+
+class _Response:
+    def __init__(self, text: str):
+        self.text = text
+
+class _Models:
+    def __init__(self, client: "FakeClient"):
+        self._client = client
+
+    async def generate_content(self, model: str, contents, config=None):
+        return await self._client._generate(contents)
+
+class _Caches:
+    async def create(self, model: str, config=None):
+        # Behave like a prompt that is too small to cache
+        raise ValueError("Cached content is too small")
+
+class _Aio:
+    def __init__(self, client: "FakeClient"):
+        self.models = _Models(client)
+        self.caches = _Caches()
+
+class FakeClient:
+    """Offline stand-in for `genai.Client` that answers with scripted decisions.
+
+    Each call sleeps for `latency` ± `jitter` seconds to mimic the model's
+    round-trip, then returns the next step of the script for the run's fixture.
+    """
+    def __init__(self, latency: float = 1.0, jitter: float = 0.2, seed: int | None = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = 0
+        self.aio = _Aio(self)
+        self._turns: dict[str, int] = {}
+        self._random = random.Random(seed)
+
+    async def _generate(self, contents) -> _Response:
+        self.calls += 1
+        prompt = _prompt_text(contents)
+        match = _TAG_RE.search(prompt)
+        if not match:
+            raise ValueError("Benchmark focus must contain a [fixture#n] tag")
+
+        tag = match.group(0)
+        script = SCRIPTS[match.group(1)]
+        turn = self._turns.get(tag, 0)
+        self._turns[tag] = turn + 1
+        step = script[min(turn, len(script) - 1)]
+
+        delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+        await asyncio.sleep(delay)
+        return _Response(json.dumps({
+            "observation": f"Scripted step {turn + 1} of {match.group(1)}",
+            "reasoning": "Benchmark script",
+            **step,
+        }))
+
+def _prompt_text(contents) -> str:
+    texts = []
+    for content in contents:
+        for part in content.get("parts", []):
+            if "text" in part:
+                texts.append(part["text"])
+    return "\n".join(texts)
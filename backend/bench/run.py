@@ -0,0 +1,211 @@
+"""Offline benchmark for the agent loop.
+
+Serves the static fixture sites in bench/fixtures, replaces the Gemini client
+with a scripted stand-in, and drives runs at several concurrency levels:
+
+    python -m bench.run --concurrency 1,4,16 --runs 16 --llm-latency 1.0
+
+`--mode direct` calls run_agent itself; `--mode api` goes through
+POST /api/test/ and the scheduler. Only Chromium is needed, no network.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+from functools import partial
+from pathlib import Path
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+# Keep benchmark artifacts out of the real data directory
+_data_dir = tempfile.mkdtemp(prefix="testpilot-bench-")
+os.environ.setdefault("GEMINI_API_KEY", "offline")
+os.environ.setdefault("BLOB_DIR", f"{_data_dir}/blobs")
+os.environ.setdefault("TRAJECTORY_DIR", f"{_data_dir}/trajectories")
+os.environ.setdefault("RESOURCE_CACHE_DIR", f"{_data_dir}/resource-cache")
+os.environ.setdefault("TRACE_DIR", f"{_data_dir}/traces")
+os.environ.setdefault("STORE_PATH", f"{_data_dir}/store.db")
+
+from app.models import TestRun
+from app.store import store
+from app.socketio import broadcaster
+from app.services import gemini
+from app.services.agent import run_agent
+from app.services.browser_pool import browser_pool
+from app.services.scheduler import scheduler
+from bench.fake_gemini import FakeClient, SCRIPTS
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+TERMINAL = {"complete", "failed", "cancelled"}
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+def serve_fixtures() -> tuple[ThreadingHTTPServer, str]:
+    """Serve the fixture sites on a random local port."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(_QuietHandler, directory=str(FIXTURES_DIR)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def process_tree_rss() -> int:
+    """Resident memory in bytes of this process and all its descendants (Linux only)."""
+    children: dict[int, list[int]] = {}
+    for entry in Path("/proc").iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_text()
+        except OSError:
+            continue
+        # The command name may contain spaces, so split after its closing paren
+        ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(entry.name))
+
+    total = 0
+    pending = [os.getpid()]
+    while pending:
+        pid = pending.pop()
+        pending.extend(children.get(pid, []))
+        try:
+            for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1]) * 1024
+                    break
+        except OSError:
+            pass
+    return total
+
+class Sampler:
+    """Tracks peak RSS and browser count while a benchmark level runs."""
+    def __init__(self, interval: float = 0.25):
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_browsers = 0
+        self._task = None
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, *exc):
+        self._task.cancel()
+        self._sample()
+
+    async def _run(self):
+        while True:
+            self._sample()
+            await asyncio.sleep(self.interval)
+
+    def _sample(self):
+        if sys.platform.startswith("linux"):
+            self.peak_rss = max(self.peak_rss, process_tree_rss())
+        self.peak_browsers = max(self.peak_browsers, browser_pool.stats()["browsers"])
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def turn_latencies(test_ids: list[str]) -> list[float]:
+    """Seconds between consecutive actions of each run."""
+    latencies = []
+    for test_id in test_ids:
+        actions = store.get(test_id).actions
+        for prev, cur in zip(actions, actions[1:]):
+            latencies.append((cur.timestamp - prev.timestamp).total_seconds())
+    return latencies
+
+def focuses(base_url: str, count: int, offset: int) -> list[tuple[str, str]]:
+    """Round-robin the fixtures; the [fixture#n] tag keys the fake model's script."""
+    names = sorted(SCRIPTS)
+    jobs = []
+    for n in range(offset, offset + count):
+        name = names[n % len(names)]
+        jobs.append((f"{base_url}/{name}.html", f"[{name}#{n}] Exercise the {name} fixture"))
+    return jobs
+
+async def run_direct(jobs: list[tuple[str, str]], concurrency: int) -> list[str]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(url: str, focus: str) -> str:
+        test_id = f"bench_{focus.split(']')[0][1:]}"
+        store.set(test_id, TestRun(id=test_id, url=url, focus=focus, status="running", created_at=datetime.now()))
+        async with semaphore:
+            await run_agent(test_id, url, focus, broadcaster)
+        return test_id
+
+    return await asyncio.gather(*(one(url, focus) for url, focus in jobs))
+
+async def run_api(jobs: list[tuple[str, str]], concurrency: int) -> list[str]:
+    import httpx
+    from app.main import app
+
+    scheduler.concurrency = concurrency
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        test_ids = []
+        for url, focus in jobs:
+            response = await client.post("/api/test/", json={"url": url, "focus": focus})
+            response.raise_for_status()
+            test_ids.append(response.json()["id"])
+
+        pending = set(test_ids)
+        while pending:
+            await asyncio.sleep(0.2)
+            for test_id in list(pending):
+                response = await client.get(f"/api/test/{test_id}", params={"fields": "status"})
+                if response.json()["status"] in TERMINAL:
+                    pending.discard(test_id)
+        return test_ids
+
+async def main(args) -> None:
+    server, base_url = serve_fixtures()
+    fake = FakeClient(latency=args.llm_latency, jitter=args.llm_jitter, seed=args.seed)
+    gemini._client = fake
+    runner = run_direct if args.mode == "direct" else run_api
+
+    print(f"mode={args.mode} runs={args.runs} llm_latency={args.llm_latency}s±{args.llm_jitter}s")
+    print(f"{'conc':>5} {'runs/min':>9} {'turn p50':>9} {'turn p95':>9} {'turn p99':>9} {'failed':>7} {'peak RSS':>10} {'browsers':>9}")
+
+    offset = 0
+    try:
+        for concurrency in args.concurrency:
+            jobs = focuses(base_url, args.runs, offset)
+            offset += args.runs
+            started = time.monotonic()
+            async with Sampler() as sampler:
+                test_ids = await runner(jobs, concurrency)
+            elapsed = time.monotonic() - started
+
+            latencies = turn_latencies(test_ids)
+            failed = sum(1 for test_id in test_ids if store.get(test_id).status != "complete")
+            print(
+                f"{concurrency:>5} {len(test_ids) / elapsed * 60:>9.1f} "
+                f"{percentile(latencies, 50):>8.2f}s {percentile(latencies, 95):>8.2f}s {percentile(latencies, 99):>8.2f}s "
+                f"{failed:>7} {sampler.peak_rss / 2**20:>8.0f}MB {sampler.peak_browsers:>9}"
+            )
+    finally:
+        await scheduler.shutdown()
+        await browser_pool.close()
+        server.shutdown()
+
+    print(f"model calls: {fake.calls}, browser pool: {browser_pool.stats()}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["direct", "api"], default="direct")
+    parser.add_argument("--concurrency", type=lambda s: [int(c) for c in s.split(",")], default=[1, 4, 8])
+    parser.add_argument("--runs", type=int, default=12, help="Runs per concurrency level")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="Mean fake model latency in seconds")
+    parser.add_argument("--llm-jitter", type=float, default=0.2, help="Uniform jitter around the latency")
+    parser.add_argument("--seed", type=int, default=None)
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -3,7 +3,9 @@
 import { useState, useEffect, useRef } from "react";
 import {
   ArrowLeft,
+  Ban,
   CheckCircle2,
+  Clock,
   History,
   Loader2,
   Sparkles,
@@ -13,7 +15,7 @@ import Link from "next/link";
 import { Button } from "@/components/ui/button";
 import { Card, CardContent } from "@/components/ui/card";
 
-import { getTest, type TestRun, type TestCase, type Action } from "@/lib/api";
+import { getTest, screenshotUrl, type TestRun, type TestCase, type Action } from "@/lib/api";
 import { io } from "socket.io-client";
 import Image from "next/image";
 import { useData } from "@/hooks/useData";
@@ -103,6 +105,36 @@ export default function TestSessionClient({
       });
     });
 
+    // A planned case finished; merge its outcome into the case listed by "testcase"
+    newSocket.on("case", ({ id, ...update }: Pick<TestCase, "id" | "status" | "actual" | "screenshot">) => {
+      setTestRun((prev: TestRun | null) => {
+        if (!prev) return prev;
+        return {
+          ...prev,
+          cases: prev.cases.map((testCase) => (testCase.id === id ? { ...testCase, ...update } : testCase)),
+        };
+      });
+    });
+
+    newSocket.on("status", ({ test_id, ...delta }: Partial<TestRun> & { test_id: string }) => {
+      setTestRun((prev: TestRun | null) => {
+        if (!prev) return prev;
+        return {
+          ...prev,
+          ...delta,
+        };
+      });
+    });
+
+    // Some actions were dropped because we fell behind; re-read the whole run
+    newSocket.on("resync", async () => {
+      try {
+        setTestRun(await getTest(sessionId));
+      } catch (error) {
+        console.error("Failed to resync test run:", error);
+      }
+    });
+
     newSocket.on("complete", () => {
       setTestRun((prev: TestRun | null) => {
         if (!prev) return prev;
@@ -154,7 +186,7 @@ export default function TestSessionClient({
 
   // Poll for updates periodically (fallback if Socket.io fails)
   useEffect(() => {
-    if (!testRun || testRun.status === "complete" || testRun.status === "failed") return;
+    if (!testRun || testRun.status === "complete" || testRun.status === "failed" || testRun.status === "cancelled") return;
 
     const interval = setInterval(async () => {
       try {
@@ -222,6 +254,12 @@ export default function TestSessionClient({
               </div>
               {testRun && (
                 <div className="text-xs">
+                  {testRun.status === "queued" && (
+                    <div className="flex items-center gap-1.5 text-gray-400">
+                      <Clock className="h-4 w-4" />
+                      <span>Queued</span>
+                    </div>
+                  )}
                   {testRun.status === "running" && (
                     <div className="flex items-center gap-1.5 text-blue-400">
                       <Loader2 className="h-4 w-4 animate-spin" />
@@ -240,6 +278,12 @@ export default function TestSessionClient({
                       <span>Failed</span>
                     </div>
                   )}
+                  {testRun.status === "cancelled" && (
+                    <div className="flex items-center gap-1.5 text-gray-400">
+                      <Ban className="h-4 w-4" />
+                      <span>Cancelled</span>
+                    </div>
+                  )}
                 </div>
               )}
             </div>
@@ -311,10 +355,11 @@ export default function TestSessionClient({
                   <div className="text-xs text-gray-400 mb-2">Current View</div>
                   <div className="border border-gray-700 rounded-lg overflow-hidden">
                     <Image
-                      src={`data:image/png;base64,${testRun.actions[testRun.actions.length - 1].screenshot}`}
+                      src={screenshotUrl(testRun.id, testRun.actions[testRun.actions.length - 1].screenshot!)}
                       alt="Current browser view"
                       width={1440}
                       height={900}
+                      unoptimized
                       className="w-full h-auto"
                     />
                   </div>
@@ -16,6 +16,7 @@ export interface Action {
   value?: string;
   reasoning?: string;
   screenshot?: string;
+  case_id?: string;
   timestamp: string;
 }
 
@@ -33,11 +34,16 @@ export interface TestRun {
   id: string;
   url: string;
   focus?: string;
-  status: "running" | "complete" | "failed";
+  status: "queued" | "running" | "complete" | "failed" | "cancelled";
   actions: Action[];
   cases: TestCase[];
   created_at: string;
   completed_at?: string;
+  queue_position?: number;
+  wait_seconds?: number;
+  parse_failures?: number;
+  wasted_calls?: number;
+  trace?: boolean;
 }
 
 /**
@@ -79,6 +85,13 @@ export async function getTest(testId: string): Promise<TestRun> {
   return response.json();
 }
 
+/**
+ * URL of a screenshot recorded by a test run
+ */
+export function screenshotUrl(testId: string, hash: string): string {
+  return `${API_BASE_URL}/api/test/${testId}/screenshots/${hash}`;
+}
+
 /**
  * Get test cases for a test run
  */